@@ -1,3 +1,22 @@
-""" The names available at the root of the namespace """
-from asset_allocation.app import AppAggregate
-from asset_allocation.formatters import AsciiFormatter, HtmlFormatter
+"""
+The names available at the root of the namespace.
+They are imported on first access, so that importing a submodule, i.e. the cli,
+does not load the whole GnuCash and price database stack.
+"""
+import importlib
+
+__all__ = ["AppAggregate", "AsciiFormatter", "HtmlFormatter"]
+
+# name -> module where it is defined
+lazy_names = {
+    "AppAggregate": "asset_allocation.app",
+    "AsciiFormatter": "asset_allocation.formatters",
+    "HtmlFormatter": "asset_allocation.formatters",
+}
+
+
+def __getattr__(name: str):
+    if name not in lazy_names:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module = importlib.import_module(lazy_names[name])
+    return getattr(module, name)
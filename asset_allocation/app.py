@@ -2,12 +2,16 @@
 Application Aggregate
 Main entry point.
 """
-from typing import List
+from decimal import Decimal
+from typing import Dict, List
 
-from .config import Config, ConfigKeys
+from .cache import ModelCache
+from . import profiling
+from .config import ConfigKeys, get_config
 from .dal import AssetClass, AssetClassStock
-from .loader import AssetAllocationLoader
-from .model import AssetAllocationModel
+from .model import AssetAllocationModel, Stock
+from .rebalancing import ContributionAllocator, ContributionPlan, Rebalancer, RebalancingPlan
+from .validation import ModelValidator, ValidationReport
 
 
 class AppAggregate:
@@ -16,6 +20,8 @@ class AppAggregate:
     def __init__(self):
         self.session = None
         self.logger = None
+        # The loader of the last model, kept for the price refreshes.
+        self.loader = None
 
     def create_asset_class(self, item: AssetClass):
         """ Inserts the record """
@@ -47,35 +53,68 @@ class AppAggregate:
         self.session.delete(to_delete)
         self.save()
 
-    def find_unallocated_holdings(self):
-        """ Identifies any holdings that are not included in asset allocation """
+    def find_unallocated_holdings(self) -> List[Stock]:
+        """
+        Identifies any holdings that are not included in asset allocation.
+        Returns the holdings with their quantities and values in base currency,
+        the most valuable first.
+        """
+        from .stocks import StocksInfo
+
         # Get linked securities
         session = self.open_session()
-        linked_entities = session.query(AssetClassStock).all()
-        linked = []
-        # linked = map(lambda x: f"{x.symbol}", linked_entities)
-        for item in linked_entities:
-            linked.append(item.symbol)
+        linked = {symbol for (symbol,) in session.query(AssetClassStock.symbol)}
 
         # Get all securities with balance > 0.
-        from .stocks import StocksInfo
-
         stocks = StocksInfo()
         stocks.logger = self.logger
-        holdings = stocks.get_symbols_with_positive_balances()
+        balances = stocks.load_security_balances()
 
         # Find those which are not included in the stock links.
         non_alloc = []
-        index = -1
-        for item in holdings:
-            try:
-                index = linked.index(item)
-                self.logger.debug(index)
-            except ValueError:
-                non_alloc.append(item)
+        for symbol in sorted(balances.keys() - linked):
+            holding = Stock(symbol)
+            holding.quantity = balances[symbol]
+            non_alloc.append(holding)
+
+        self.__value_holdings(non_alloc, stocks)
+        stocks.close_databases()
 
+        # Holdings without a price or a rate go last.
+        non_alloc.sort(key=lambda holding: (holding.value_in_base_currency is None,
+                                            -(holding.value_in_base_currency or 0)))
         return non_alloc
 
+    def __value_holdings(self, holdings: List[Stock], stocks):
+        """ Loads the latest prices and rates and calculates the values in base currency """
+        from pricedb import SecuritySymbol
+        from .currency import CurrencyConverter
+
+        symbols = {}
+        for holding in holdings:
+            symbol = SecuritySymbol("", "")
+            symbol.parse(holding.symbol)
+            symbols[holding.symbol] = symbol
+        prices = stocks.load_latest_prices(list(symbols.values()))
+
+        base_currency = get_config().get(ConfigKeys.default_currency)
+        conv = CurrencyConverter()
+        conv.load_currencies([price.currency for price in prices.values()
+                              if price.currency != base_currency])
+        conv.close_database()
+
+        for holding in holdings:
+            symbol = symbols[holding.symbol]
+            price = prices.get((symbol.namespace, symbol.mnemonic))
+            if not price:
+                continue
+            holding.price = price.value
+            holding.currency = price.currency
+            if price.currency == base_currency:
+                holding.value_in_base_currency = holding.value
+            elif price.currency in conv.rates:
+                holding.value_in_base_currency = holding.value * conv.rates[price.currency].value
+
     def get(self, id: int) -> AssetClass:
         """ Loads Asset Class """
         self.open_session()
@@ -87,7 +126,7 @@ class AppAggregate:
         """ Opens a db session and returns it """
         from .dal import get_session
 
-        cfg = Config()
+        cfg = get_config()
         cfg.logger = self.logger
         db_path = cfg.get(ConfigKeys.asset_allocation_database_path)
 
@@ -98,9 +137,31 @@ class AppAggregate:
         """ Saves the entity """
         self.session.commit()
 
-    def get_asset_allocation(self):
-        """ Creates and populates the Asset Allocation model. The main function of the app. """
+    @profiling.profiled("get_asset_allocation")
+    def get_asset_allocation(self, concurrent: bool = False, use_cache: bool = True,
+                             batched: bool = True):
+        """
+        Creates and populates the Asset Allocation model. The main function of the app.
+        With concurrent, the GnuCash and price database reads run in parallel.
+        The model is returned from the cache if none of the source databases changed.
+        Without batched, the quantities and prices are read one security at a time,
+        i.e. to trace them. Only used when not concurrent.
+        """
+        if use_cache:
+            cache = ModelCache()
+            cache.logger = self.logger
+            # Take the fingerprint before loading, so that any changes during the load
+            # invalidate the cached model.
+            with profiling.stage("cache_load"):
+                fingerprint = cache.get_fingerprint()
+                model = cache.load(fingerprint)
+            if model:
+                return model
+
         # load from db
+        with profiling.stage("import_loader"):
+            from .loader import AssetAllocationLoader
+
         # TODO set the base currency
         base_currency = "EUR"
 
@@ -108,28 +169,63 @@ class AppAggregate:
         loader.logger = self.logger
         model = loader.load_tree_from_db()
 
-        model.validate()
+        with profiling.stage("validate"):
+            model.validate()
 
         # securities
         # read stock links
         loader.load_stock_links()
-        # read stock quantities from GnuCash
-        loader.load_stock_quantity()
-        # Load cash balances
-        loader.load_cash_balances()
-        # loader.session
-        # read prices from Prices database
-        loader.load_stock_prices()
+        if concurrent:
+            # quantities, cash balances and prices at the same time
+            loader.load_holdings_concurrently()
+        else:
+            # read stock quantities from GnuCash
+            loader.load_stock_quantity(batched)
+            # Load cash balances
+            loader.load_cash_balances()
+            # loader.session
+            # read prices from Prices database
+            loader.load_stock_prices(batched)
         # recalculate stock values into base currency
         loader.recalculate_stock_values_into_base()
+        loader.close_databases()
+        self.loader = loader
         # calculate
-        model.calculate_current_value()
-        model.calculate_set_values()
-        model.calculate_current_allocation()
+        with profiling.stage("recalculate_model"):
+            model.recalculate()
+
+        if use_cache:
+            try:
+                with profiling.stage("cache_save"):
+                    cache.save(model, fingerprint)
+            except OSError as error:
+                if self.logger:
+                    self.logger.warning(f"Could not save the model cache: {error}")
 
         # return the model for display
         return model
 
+    def refresh_prices(self, model: AssetAllocationModel) -> AssetAllocationModel:
+        """
+        Updates an already loaded model with the latest prices and exchange rates.
+        Much cheaper than loading the whole model again.
+        The loader is kept between the refreshes, with the parsed symbols and the
+        currency converter.
+        """
+        loader = self.loader
+        if loader is None or loader.model is not model:
+            # i.e. a model from the cache
+            from .loader import AssetAllocationLoader
+
+            loader = AssetAllocationLoader(base_currency=model.currency)
+            loader.logger = self.logger
+            loader.model = model
+            self.loader = loader
+
+        model = loader.refresh_prices()
+        loader.close_databases()
+        return model
+
     def get_asset_classes_for_security(self, namespace: str, symbol: str) -> List[AssetClass]:
         """ Find all asset classes (should be only one at the moment, though!) to which the symbol belongs """
         full_symbol = symbol
@@ -143,16 +239,40 @@ class AppAggregate:
         )
         return result
 
-    def validate_model(self):
-        """ Validate the model """
-        model: AssetAllocationModel = self.get_asset_allocation_model()
+    def validate_model(self) -> ValidationReport:
+        """ Validate the model. Returns the report with all the issues found. """
+        model: AssetAllocationModel = self.get_asset_allocation()
         model.logger = self.logger
 
-        valid = model.validate()
-        if valid:
-            print(f"The model is valid. Congratulations")
-        else:
-            print(f"The model is invalid.")
+        with profiling.stage("validate_model"):
+            return ModelValidator(model).validate()
+
+    def rebalance(self, threshold: Decimal = Decimal(0), min_trade: Decimal = Decimal(0),
+                  thresholds: Dict[str, Decimal] = None,
+                  use_cache: bool = True) -> RebalancingPlan:
+        """
+        Trades that bring the leaf asset classes within the threshold, in % of the set value.
+        The thresholds by class full name apply to the whole branch and take precedence.
+        No trade is smaller than min_trade.
+        """
+        model = self.get_asset_allocation(use_cache=use_cache)
+
+        rebalancer = Rebalancer(model)
+        rebalancer.threshold = threshold
+        rebalancer.thresholds = thresholds or {}
+        rebalancer.min_trade = min_trade
+        with profiling.stage("rebalance"):
+            return rebalancer.rebalance()
+
+    def allocate_contribution(self, amount: Decimal, use_cache: bool = True) -> ContributionPlan:
+        """
+        Distributes the amount, in base currency, over the most underweight leaf classes.
+        A negative amount is a withdrawal, taken from the most overweight classes.
+        """
+        model = self.get_asset_allocation(use_cache=use_cache)
+
+        with profiling.stage("allocate_contribution"):
+            return ContributionAllocator(model).allocate(amount)
 
     def export_symbols(self):
         """ Exports all used symbols """
@@ -8,9 +8,6 @@ import click
 import logging
 import click_log
 
-from asset_allocation.app import AppAggregate
-from asset_allocation.dal import AssetClass
-
 # Initialize click log.
 logger = logging.getLogger(__name__)
 click_log.basic_config(logger)
@@ -27,6 +24,9 @@ def ac():
 @click.argument("name") # , "-n"
 def add(name):
     """ Add new Asset Class """
+    from asset_allocation.app import AppAggregate
+    from asset_allocation.dal import AssetClass
+
     item = AssetClass()
     item.name = name
     app = AppAggregate()
@@ -39,6 +39,8 @@ def add(name):
 @click.argument("id", type=int)
 def delete(id):
     """ Deletes asset class record """
+    from asset_allocation.app import AppAggregate
+
     app = AppAggregate()
     app.delete(id)
 
@@ -49,6 +51,8 @@ def delete(id):
 @click.option("--alloc", "-a", type=Decimal)
 def edit(id: int, parent: int, alloc: Decimal):
     """ Edit asset class """
+    from asset_allocation.app import AppAggregate
+
     saved = False
 
     # load
@@ -82,6 +86,9 @@ def edit(id: int, parent: int, alloc: Decimal):
 @click.command("list")
 def my_list():
     """ Lists all asset classes """
+    from asset_allocation.app import AppAggregate
+    from asset_allocation.dal import AssetClass
+
     session = AppAggregate().open_session()
     classes = session.query(AssetClass).all()
     for item in classes:
@@ -90,41 +97,37 @@ def my_list():
 
 @click.command("import")
 @click.argument("file")
-def my_import(file):
+@click.option("--upsert", is_flag=True, default=False,
+              help="Update the existing classes with the same name instead of adding new ones")
+@click.option("--dry-run", is_flag=True, default=False,
+              help="Validate the file and roll the changes back")
+@click.option("--batch-size", type=int, default=1000, help="Rows written per statement")
+def my_import(file, upsert: bool, dry_run: bool, batch_size: int):
     """ Import Asset Class(es) from a .csv file """
     # , help="The path to the CSV file to import. The first row must contain column names."
-    lines = None
-    with open(file) as csv_file:
-        lines = csv_file.readlines()
+    from asset_allocation.app import AppAggregate
+    from asset_allocation.dal import AssetClass
+    from asset_allocation.importer import CsvImporter
 
-    # Header, the first line.
-    header = lines[0]
-    lines.remove(header)
-    header = header.rstrip()
+    session = AppAggregate().open_session()
+    importer = CsvImporter(session, AssetClass, key="name", batch_size=batch_size)
+    importer.upsert = upsert
+    importer.dry_run = dry_run
+    report = importer.import_file(file)
+    session.close()
 
-    # Parse records from a csv row.
-    counter = 0
-    app = AppAggregate()
-    app.open_session()
-    for line in lines:
-        # Create insert statements
-        line = line.rstrip()
-        command = f"insert into AssetClass ({header}) values ({line});"
-        # insert records
-        app.session.execute(command)
-        try:
-            app.save()
-        except:
-            print(f"error: ", sys.exc_info()[0])
-            app.session.close()
-        counter += 1
-    print(f"Data imported. {counter} rows created.")
+    print(report.format())
+    if not report.is_valid:
+        sys.exit(1)
 
 
 @click.command("tree")
 @click_log.simple_verbosity_option(logger)
 def tree():
     """ Display a tree of asset classes """
+    from asset_allocation.app import AppAggregate
+    from asset_allocation.dal import AssetClass
+
     session = AppAggregate().open_session()
     classes = session.query(AssetClass).all()
     # Get the root classes
@@ -0,0 +1,115 @@
+"""
+Cache for the computed Asset Allocation model.
+The model is stored in a binary file next to the user config and reused as long as
+none of the source databases have changed.
+"""
+import os
+import pickle
+from datetime import date
+
+from .config import Config, ConfigKeys, get_config
+from .model import AssetAllocationModel
+
+cache_filename = "asset_allocation.cache"
+# Increment when the model classes change, to discard old cache files.
+CACHE_VERSION = 10
+
+
+class ModelCache:
+    """ Stores the computed model, keyed by the fingerprints of the source files """
+
+    def __init__(self, config: Config = None, cache_path: str = None):
+        self.config = config if config else get_config()
+        self.cache_path = cache_path
+        self.logger = None
+
+    def get_cache_path(self) -> str:
+        """ The cache file is kept in the same directory as the user config """
+        if not self.cache_path:
+            config_dir = os.path.dirname(self.config.get_config_path())
+            self.cache_path = os.path.join(config_dir, cache_filename)
+        return self.cache_path
+
+    def get_fingerprint(self) -> tuple:
+        """
+        Fingerprint of all the files the model is built from: the config,
+        the Asset Allocation database, the GnuCash book and the price database.
+        Uses the modification time and size only, so it is cheap to calculate.
+        Includes the current date, as the transactions up to today are used.
+        """
+        paths = [
+            self.config.get_config_path(),
+            self.config.get(ConfigKeys.asset_allocation_database_path),
+            self.config.get(ConfigKeys.gnucash_book_path),
+            self.__get_price_database_path()
+        ]
+        result = []
+        for path in paths:
+            # Include the SQLite write-ahead log, where recent changes may be.
+            result.append(self.__get_file_fingerprint(path))
+            result.append(self.__get_file_fingerprint(path + "-wal"))
+        result.append(date.today().isoformat())
+        return tuple(result)
+
+    def load(self, fingerprint: tuple = None) -> AssetAllocationModel:
+        """ Returns the cached model, if it was built from the current data """
+        file_path = self.get_cache_path()
+        if not os.path.exists(file_path):
+            return None
+        if fingerprint is None:
+            fingerprint = self.get_fingerprint()
+
+        try:
+            with open(file_path, mode="rb") as cache_file:
+                content = pickle.load(cache_file)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            # Unreadable or outdated cache file. It will be overwritten.
+            return None
+
+        if content.get("version") != CACHE_VERSION:
+            return None
+        if content.get("fingerprint") != fingerprint:
+            return None
+        return content["model"]
+
+    def save(self, model: AssetAllocationModel, fingerprint: tuple = None):
+        """
+        Stores the model. Pass the fingerprint taken before the model was loaded,
+        so that the changes made during the load invalidate the cache.
+        """
+        if fingerprint is None:
+            fingerprint = self.get_fingerprint()
+        content = {
+            "version": CACHE_VERSION,
+            "fingerprint": fingerprint,
+            "model": model
+        }
+
+        file_path = self.get_cache_path()
+        # Write to a temporary file first so that readers never see a partial file.
+        temp_path = file_path + ".tmp"
+        with open(temp_path, mode="wb") as cache_file:
+            pickle.dump(content, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, file_path)
+
+    def clear(self):
+        """ Deletes the cache file """
+        file_path = self.get_cache_path()
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+    def __get_file_fingerprint(self, path: str) -> tuple:
+        """ (path, modification time, size) of the file """
+        if not path:
+            return (path, None, None)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return (path, None, None)
+        return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+    def __get_price_database_path(self) -> str:
+        """ Reads the price database location from the PriceDb config """
+        from pricedb.config import Config as PriceDbConfig, ConfigKeys as PriceDbConfigKeys
+
+        return PriceDbConfig().get(PriceDbConfigKeys.price_database)
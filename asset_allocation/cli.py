@@ -1,65 +1,236 @@
 """
 Main entry point for the users (cli) to the functionality of the library.
 """
+import importlib
 import logging
+import sys
+from decimal import Decimal, InvalidOperation
 
 import click
 import click_log
 
-from asset_allocation.app import AppAggregate
-# sub-commands
-from asset_allocation.assetclass_cli import ac
-from asset_allocation.config_cli import config
-from asset_allocation.formatters import AsciiFormatter, HtmlFormatter
-from asset_allocation.stocklink_cli import sl
-
 logger = logging.getLogger(__name__)
 click_log.basic_config(logger)
 
 
-@click.group()
+class LazyGroup(click.Group):
+    """
+    Command group that imports the sub-command modules only when a sub-command is invoked.
+    Keeps the startup fast for the commands that do not need the whole
+    GnuCash and price database stack.
+    """
+    def __init__(self, *args, lazy_subcommands: dict = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # command name -> "module:attribute"
+        self.lazy_subcommands = lazy_subcommands or {}
+
+    def list_commands(self, ctx):
+        return sorted(super().list_commands(ctx) + list(self.lazy_subcommands))
+
+    def get_command(self, ctx, cmd_name):
+        if cmd_name in self.lazy_subcommands:
+            return self.__load(cmd_name)
+        return super().get_command(ctx, cmd_name)
+
+    def __load(self, cmd_name: str) -> click.Command:
+        """ Imports the module and returns the command """
+        module_name, attribute = self.lazy_subcommands[cmd_name].split(":")
+        module = importlib.import_module(module_name)
+        return getattr(module, attribute)
+
+
+@click.group(cls=LazyGroup, lazy_subcommands={
+    "ac": "asset_allocation.assetclass_cli:ac",
+    "config": "asset_allocation.config_cli:config",
+    "sl": "asset_allocation.stocklink_cli:sl",
+})
 @click_log.simple_verbosity_option(logger)
 def cli():
     pass
 
 
+class DecimalType(click.ParamType):
+    """ Parses amounts and percentages as Decimal, without going through float """
+    name = "decimal"
+
+    def convert(self, value, param, ctx):
+        if isinstance(value, Decimal):
+            return value
+        try:
+            result = Decimal(value)
+        except InvalidOperation:
+            result = None
+        if result is None or not result.is_finite():
+            self.fail(f"{value} is not a valid number", param, ctx)
+        return result
+
+
+DECIMAL = DecimalType()
+
+
+profile_option = click.option(
+    "--profile", type=click.Choice(["text", "json"]), is_flag=False, flag_value="text",
+    default=None, help="Print the time, SQL statements and rows per stage to stderr, "
+                       "as a table or as JSON (--profile json)")
+
+
+trace_option = click.option(
+    "--trace", type=click.Path(dir_okay=False, writable=True), default=None,
+    help="Save the stages in Chrome trace-event format to the given file")
+
+
 @click.command()
 @click.option("--format", default="ascii", help="format for the report output. ascii or html.")
 @click.option("--full", is_flag=True, default=False, help="Display full model with securities")
+@click.option("--concurrent", is_flag=True, default=False,
+              help="Read GnuCash and price data in parallel")
+@click.option("--no-cache", is_flag=True, default=False,
+              help="Rebuild the model even if the data has not changed")
+@click.option("--per-symbol", is_flag=True, default=False,
+              help="Read the quantities and prices one security at a time, "
+                   "i.e. to trace them. Implies --no-cache.")
+@profile_option
+@trace_option
 @click_log.simple_verbosity_option(logger)
-def show(format, full):
+def show(format, full, concurrent, no_cache, per_symbol, profile, trace):
     """ Print current allocation to the console. """
+    from asset_allocation import profiling
+    from asset_allocation.app import AppAggregate
+    from asset_allocation.formatters import AsciiFormatter, HtmlFormatter
+
+    if profile or trace:
+        profiler = profiling.enable()
+
     # load asset allocation
     app = AppAggregate()
     app.logger = logger
-    model = app.get_asset_allocation()
+    model = app.get_asset_allocation(concurrent=concurrent,
+                                     use_cache=not (no_cache or per_symbol),
+                                     batched=not per_symbol)
 
     if format == "ascii":
         formatter = AsciiFormatter()
     elif format == "html":
-        formatter = HtmlFormatter
+        formatter = HtmlFormatter()
     else:
         raise ValueError(f"Unknown formatter {format}")
 
     # formatters can display stock information with --full
-    output = formatter.format(model, full=full)
-    print(output)
+    # Rows are written as they are formatted.
+    with profiling.stage("format"):
+        formatter.write(model, sys.stdout, full=full)
+
+    if profile or trace:
+        print_profile(profiler, profile, trace)
 
 
 @click.command()
+@profile_option
+@trace_option
 @click_log.simple_verbosity_option(logger)
-def validate():
+def validate(profile, trace):
     """ validate asset allocation model """
+    from asset_allocation import profiling
+    from asset_allocation.app import AppAggregate
+
+    if profile or trace:
+        profiler = profiling.enable()
+
+    app = AppAggregate()
+    app.logger = logger
+    report = app.validate_model()
+    print(report.format())
+
+    if profile or trace:
+        print_profile(profiler, profile, trace)
+
+
+def parse_class_thresholds(ctx, param, values) -> dict:
+    """ NAME=PCT pairs into a dictionary of thresholds by class full name """
+    result = {}
+    for value in values:
+        name, _, threshold = value.rpartition("=")
+        try:
+            result[name] = Decimal(threshold)
+        except InvalidOperation:
+            name = None
+        if not name:
+            raise click.BadParameter(f"{value} is not in the NAME=PCT format, "
+                                     "i.e. Equity:International=10")
+    return result
+
+
+@click.command()
+@click.option("--threshold", type=DECIMAL, default="0",
+              help="Tolerance, in % of the set value, for the classes without a threshold")
+@click.option("--class-threshold", multiple=True, callback=parse_class_thresholds,
+              help="Tolerance for a class and its branch, as NAME=PCT with the full class "
+                   "name, i.e. Equity:International=10. Can be repeated.")
+@click.option("--min-trade", type=DECIMAL, default="0",
+              help="The smallest trade, in base currency")
+@click.option("--no-cache", is_flag=True, default=False,
+              help="Rebuild the model even if the data has not changed")
+@click_log.simple_verbosity_option(logger)
+def rebalance(threshold, class_threshold, min_trade, no_cache):
+    """ List the trades that bring the allocation back to the set values """
+    from asset_allocation.app import AppAggregate
+
     app = AppAggregate()
     app.logger = logger
-    app.validate_model()
+    try:
+        plan = app.rebalance(threshold, min_trade, class_threshold, use_cache=not no_cache)
+    except ValueError as error:
+        # i.e. an unknown class in --class-threshold
+        raise click.ClickException(str(error))
+    print(plan.format())
+
+
+@click.command()
+@click.argument("amount", type=DECIMAL)
+@click.option("--withdraw", is_flag=True, default=False,
+              help="Take the amount out of the most overweight classes instead")
+@click.option("--no-cache", is_flag=True, default=False,
+              help="Rebuild the model even if the data has not changed")
+@click_log.simple_verbosity_option(logger)
+def contribute(amount, withdraw, no_cache):
+    """ Distribute new money, in base currency, over the most underweight classes """
+    from asset_allocation.app import AppAggregate
+
+    if amount <= 0:
+        raise click.BadParameter("The amount must be positive. Use --withdraw for withdrawals.",
+                                 param_hint="AMOUNT")
+    if withdraw:
+        amount = -amount
+
+    app = AppAggregate()
+    app.logger = logger
+    plan = app.allocate_contribution(amount, use_cache=not no_cache)
+    print(plan.format())
+
+
+def print_profile(profiler, profile_format: str, trace_path: str):
+    """
+    Prints the recorded stages to stderr, so that they do not mix with the report,
+    and/or saves the trace file. In json format, stderr has only the JSON document.
+    """
+    from asset_allocation import profiling
+
+    profiling.disable()
+    if trace_path:
+        profiler.save_trace(trace_path)
+        if profile_format != "json":
+            logger.info(f"Trace saved to {trace_path}")
+
+    if profile_format == "json":
+        print(profiler.to_json(), file=sys.stderr)
+    elif profile_format:
+        print(profiler.format(), file=sys.stderr)
 
 
-cli.add_command(ac)
-cli.add_command(sl)
 cli.add_command(show)
-cli.add_command(config)
 cli.add_command(validate)
+cli.add_command(rebalance)
+cli.add_command(contribute)
 
 ##############################
 # For debugging.
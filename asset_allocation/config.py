@@ -1,23 +1,27 @@
 """
 Configuration handling
-The config template file is stored in data directory and is located by using Resources. The 
+The config template file is stored in the package's templates directory. The
 template is copied to a working copy in the user's home directory on first use.
-Ref: http://peak.telecommunity.com/DevCenter/setuptools#non-package-data-files
+Use get_config() to get the config shared in the process. The file is parsed once
+and read again only when it changes.
 """
 import io
 import os.path
 import shutil
+import threading
 from configparser import ConfigParser
 from enum import Enum, auto
 from logging import DEBUG, ERROR, log
 
-from pkg_resources import Requirement, resource_filename
-
 package_name = "Asset-Allocation"
 config_filename = "asset_allocation.ini"
 config_folder = "asset_allocation/templates/"
 SECTION = "Default"
 
+# Shared config instances, by absolute file path.
+_configs = {}
+_configs_lock = threading.Lock()
+
 
 class ConfigKeys(Enum):
     asset_allocation_database_path = auto(),
@@ -35,6 +39,10 @@ class Config:
         # Read the config file on creation of the object.
         self.config = ConfigParser()
 
+        # The file that was read and its (modification time, size) at the time.
+        self.file_path: str = None
+        self.file_stamp: tuple = None
+
         if not ini_path:
             # use the default path.
             file_path = os.path.abspath(self.get_config_path())
@@ -46,6 +54,15 @@ class Config:
 
         self.__read_config(file_path)
 
+    def is_changed(self) -> bool:
+        """ Checks if the file has been modified since it was read """
+        return get_file_stamp(self.file_path) != self.file_stamp
+
+    def reload(self):
+        """ Reads the file again """
+        self.config = ConfigParser()
+        self.__read_config(self.file_path)
+
     def delete_user_config(self):
         """ Delete current user's config file """
         file = self.get_config_path()
@@ -60,17 +77,13 @@ class Config:
             log(ERROR, "file not found: %s", file_path)
             raise FileNotFoundError("configuration file not found %s", file_path)
 
+        self.file_path = file_path
+        self.file_stamp = get_file_stamp(file_path)
         self.config.read(file_path)
 
     def __get_config_template_path(self) -> str:
-        """ gets the default config path from resources """
-        filename = resource_filename(Requirement.parse(package_name),
-                                     config_folder + config_filename)
-        return filename
-
-    def __get_user_path(self) -> str:
-        """ Returns the current user's home directory """
-        return os.path.expanduser("~")
+        """ gets the default config path from the package data """
+        return get_resource_path(config_folder + config_filename)
 
     def __create_user_config(self):
         """ Copy the config template into user's directory """
@@ -92,9 +105,7 @@ class Config:
         Returns the path where the active config file is expected.
         This is the user's profile folder.
         """
-        dst_dir = self.__get_user_path()
-        dst = dst_dir + "/" + config_filename
-        return dst
+        return get_user_config_path()
 
     def get_contents(self) -> str:
         """ Reads the contents of the config file """
@@ -134,3 +145,53 @@ class Config:
         contents = self.get_contents()
         with open(file_path, mode='w') as cfg_file:
             cfg_file.write(contents)
+        if os.path.abspath(file_path) == self.file_path:
+            # The saved contents are already loaded.
+            self.file_stamp = get_file_stamp(file_path)
+
+
+def get_config(ini_path: str = None) -> Config:
+    """
+    Returns the config shared in the process. The user's config is used if no path is given.
+    The file is parsed on the first call and again only when its modification time
+    or size change.
+    """
+    if ini_path:
+        file_path = os.path.abspath(ini_path)
+    else:
+        file_path = os.path.abspath(get_user_config_path())
+
+    with _configs_lock:
+        cfg = _configs.get(file_path)
+        if cfg and not os.path.exists(file_path):
+            # Deleted. The user config will be created again from the template.
+            cfg = None
+        if not cfg:
+            cfg = Config(ini_path)
+            _configs[file_path] = cfg
+        elif cfg.is_changed():
+            cfg.reload()
+        return cfg
+
+
+def get_user_config_path() -> str:
+    """ The config file in the current user's home directory """
+    return os.path.expanduser("~") + "/" + config_filename
+
+
+def get_resource_path(relative_path: str) -> str:
+    """
+    The absolute path of a file distributed with the package,
+    relative to the directory containing the package.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(root, relative_path)
+
+
+def get_file_stamp(file_path: str) -> tuple:
+    """ (modification time, size) of the file, or None if it does not exist """
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
@@ -2,7 +2,7 @@
 CLI for handling config files
 """
 import click
-from asset_allocation.config import Config, ConfigKeys
+from asset_allocation.config import ConfigKeys, get_config
 
 @click.group()
 def config():
@@ -12,13 +12,13 @@ def config():
 @click.command()
 def delete():
     """ Delete the current user's config file """
-    cfg = Config()
+    cfg = get_config()
     cfg.delete_user_config()
 
 @click.command()
 def show():
     """ Show the contents of the current config file """
-    cfg = Config()
+    cfg = get_config()
     # file_path = cfg.get_config_path()
     contents = cfg.get_contents()
     print(contents)
@@ -30,7 +30,7 @@ def show():
 # @click.option("--val", help="The name of the option to set.")
 def set(aadb, cur):
     """ Sets the values in the config file """
-    cfg = Config()
+    cfg = get_config()
     edited = False
 
     if aadb:
@@ -53,7 +53,7 @@ def set(aadb, cur):
 def get(aadb: str):
     """ Retrieves a value from config """
     if (aadb):
-        cfg = Config()
+        cfg = get_config()
         value = cfg.get(ConfigKeys.asset_allocation_database_path)
         click.echo(value)
     
@@ -1,24 +1,85 @@
 """ Operations with currencies """
+from typing import Dict, List
+
 from pricedb.repositories import PriceRepository
-from pricedb import PriceDbApplication, PriceModel, SecuritySymbol
+from pricedb import PriceModel
 
 
 class CurrencyConverter:
-    """ Convert between currencies """
+    """
+    Convert between currencies.
+    The latest rates are cached per currency until invalidated.
+    """
 
-    def __init__(self):
+    def __init__(self, session=None):
+        # The rate for the currency loaded last.
         self.rate: PriceModel = None
+        # Cached latest rates, by currency mnemonic.
+        self.rates: Dict[str, PriceModel] = {}
+        # Price database session.
+        self.session = session
 
     def load_currency(self, mnemonic: str):
         """ load the latest rate for the given mnemonic; expressed in the base currency """
         # , base_currency: str <= ignored for now.
-        if self.rate and self.rate.currency == mnemonic:
-            # Already loaded.
-            return
+        if mnemonic not in self.rates:
+            self.load_currencies([mnemonic])
 
-        app = PriceDbApplication()
-        # TODO use the base_currency parameter for the query #33
-        symbol = SecuritySymbol("CURRENCY", mnemonic)
-        self.rate = app.get_latest_price(symbol)
+        self.rate = self.rates.get(mnemonic)
         if not self.rate:
             raise ValueError(f"No rate found for {mnemonic}!")
+
+    def load_currencies(self, mnemonics: List[str]):
+        """ Loads the latest rates for all the given currencies, with one query """
+        from pricedb import dal, mappers
+        from sqlalchemy import func
+
+        # TODO use the base_currency parameter for the query #33
+        missing = [mnemonic for mnemonic in set(mnemonics) if mnemonic not in self.rates]
+        if not missing:
+            return
+
+        session = self.__get_session()
+        row_number = func.row_number().over(
+            partition_by=dal.Price.symbol,
+            order_by=(dal.Price.date.desc(), dal.Price.time.desc())
+        ).label("row_number")
+        numbered = (
+            session.query(dal.Price.id, row_number)
+            .filter(dal.Price.namespace == "CURRENCY")
+            .filter(dal.Price.symbol.in_(missing))
+            .subquery()
+        )
+        query = (
+            session.query(dal.Price)
+            .join(numbered, dal.Price.id == numbered.c.id)
+            .filter(numbered.c.row_number == 1)
+        )
+
+        mapper = mappers.PriceMapper()
+        for entity in query.all():
+            self.rates[entity.symbol] = mapper.map_entity(entity)
+
+    def refresh(self):
+        """ Reloads all the cached rates """
+        mnemonics = list(self.rates.keys())
+        self.invalidate()
+        self.load_currencies(mnemonics)
+
+    def invalidate(self):
+        """ Clears the cached rates """
+        self.rates.clear()
+        self.rate = None
+
+    def close_database(self):
+        """ Releases the price database connection. The cached rates are kept. """
+        if self.session:
+            self.session.close()
+
+    def __get_session(self):
+        """ Opens the price database session """
+        from pricedb import dal
+
+        if not self.session:
+            self.session = dal.get_default_session()
+        return self.session
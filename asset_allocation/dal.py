@@ -11,6 +11,10 @@ Examples:
     loaded = session.query(dal.AssetClass).filter(dal.AssetClass.name == "test-updated").first()
     session.delete(loaded)
 """
+import os
+import threading
+from contextlib import contextmanager
+
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
@@ -19,6 +23,11 @@ from asset_allocation.config import Config, ConfigKeys
 
 Base = declarative_base()
 
+# Engines and session factories, by absolute database path.
+_engines = {}
+_session_makers = {}
+_registry_lock = threading.Lock()
+
 
 class AssetClass(Base):
     __tablename__ = 'AssetClass'
@@ -50,21 +59,61 @@ class AssetClassStock(Base):
         return "<AssetClass_Stock (assetclass=%s, symbol='%s')>" % (self.assetclassid, self.symbol)
 
 
+def get_engine(db_path: str):
+    """
+    Returns the engine for the database, shared within the process.
+    The schema is checked only when the engine is first created.
+    """
+    key = os.path.abspath(db_path)
+
+    with _registry_lock:
+        engine = _engines.get(key)
+        if not engine:
+            # connection. The absolute path, so that a change of the working directory
+            # does not open another file through the shared engine.
+            con_str = "sqlite:///" + key
+            # Display all SQLite info with echo.
+            engine = create_engine(con_str, echo=False)
+
+            # create metadata (?)
+            Base.metadata.create_all(engine)
+
+            _engines[key] = engine
+            _session_makers[key] = sessionmaker(bind=engine)
+    return engine
+
+
 def get_session(db_path: str):
     """ Creates and opens a database session """
     # cfg = Config()
     # db_path = cfg.get(ConfigKeys.asset_allocation_database_path)
-
-    # connection
-    con_str = "sqlite:///" + db_path
-    # Display all SQLite info with echo.
-    engine = create_engine(con_str, echo=False)
-
-    # create metadata (?)
-    Base.metadata.create_all(engine)
+    get_engine(db_path)
 
     # create session
-    Session = sessionmaker(bind=engine)
+    Session = _session_makers[os.path.abspath(db_path)]
     session = Session()
 
     return session
+
+
+@contextmanager
+def session_scope(db_path: str):
+    """ Provides a session that is committed on success and always closed """
+    session = get_session(db_path)
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def dispose_engines():
+    """ Closes the connections of all the cached engines and clears the registry """
+    with _registry_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+        _session_makers.clear()
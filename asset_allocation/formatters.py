@@ -1,7 +1,12 @@
 """
 Output formatters for the AA model
 """
+import io
 from decimal import Decimal
+from html import escape
+from string import Template
+from typing import TextIO
+
 from .model import AssetAllocationModel
 from .maps import ModelMapper
 from .view_model import AssetAllocationViewModel
@@ -25,12 +30,19 @@ class AsciiFormatter:
 
     def format(self, model: AssetAllocationModel, full: bool = False):
         """ Returns the view-friendly output of the aa model """
+        output = io.StringIO()
+        self.write(model, output, full)
+        return output.getvalue()
+
+    def write(self, model: AssetAllocationModel, stream: TextIO, full: bool = False):
+        """ Writes the view-friendly output of the aa model to the text stream, row by row """
         self.full = full
 
         # Header
-        output = f"Asset Allocation model, total: {model.currency} {model.total_amount:,.2f}\n"
+        stream.write(f"Asset Allocation model, total: {model.currency} {model.total_amount:,.2f}\n")
 
         # Column Headers
+        output = ""
         for column in self.columns:
             name = column['name']
             if not self.full and name == "loc.cur.":
@@ -40,14 +52,11 @@ class AsciiFormatter:
             output += f"{name:^{width}}"
         output += "\n"
         output += f"-------------------------------------------------------------------------------\n"
+        stream.write(output)
 
         # Asset classes
-
-        view_model = ModelMapper(model).map_to_linear(self.full)
-        for row in view_model:
-            output += self.__format_row(row) + "\n"
-
-        return output
+        for row in ModelMapper(model).iterate_linear(self.full):
+            stream.write(self.__format_row(row) + "\n")
 
     def __format_row(self, row: AssetAllocationViewModel):
         """ display-format one row
@@ -133,5 +142,152 @@ class AsciiFormatter:
 
 
 class HtmlFormatter:
-    """ Formats HTML output """
-    pass
+    """
+    Formats HTML output.
+    The asset class rows can be collapsed and the allocation differences are colored.
+    The templates are compiled once, when the module is loaded.
+    """
+    # Header, up to the table body.
+    page_start = Template("""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Asset Allocation</title>
+<style>
+body { font-family: sans-serif; }
+table { border-collapse: collapse; }
+th, td { padding: 2px 8px; }
+td.num { text-align: right; }
+tr.class-row { cursor: pointer; font-weight: bold; }
+tr.stock-row { color: #555; }
+tr.hidden { display: none; }
+.over { background-color: #f8d7da; }
+.under { background-color: #d4edda; }
+</style>
+</head>
+<body>
+<h1>Asset Allocation model, total: $currency $total</h1>
+<table>
+<thead><tr>$headers</tr></thead>
+<tbody>
+""")
+    row = Template("""<tr class="$row_class" data-depth="$depth">\
+<td style="padding-left: ${indent}em">$name</td>$cells</tr>
+""")
+    # Clicking an asset class row shows/hides all the rows below it.
+    page_end = Template("""</tbody>
+</table>
+<script>
+document.querySelectorAll("tr.class-row").forEach(function (row) {
+    row.addEventListener("click", function () {
+        var depth = parseInt(row.dataset.depth);
+        var collapse = !row.classList.contains("collapsed");
+        row.classList.toggle("collapsed");
+        for (var next = row.nextElementSibling; next; next = next.nextElementSibling) {
+            if (parseInt(next.dataset.depth) <= depth) break;
+            next.classList.toggle("hidden", collapse);
+            next.classList.toggle("collapsed", collapse);
+        }
+    });
+});
+</script>
+</body>
+</html>
+""")
+
+    def __init__(self, drift_threshold: Decimal = Decimal(5)):
+        self.columns = ["Asset Class", "alloc.", "cur.al.", "diff.", "al.val.", "value",
+                        "loc.cur.", "diff"]
+        self.full = False
+        # Difference in allocation, in %, from which the rows are colored.
+        self.drift_threshold = drift_threshold
+
+    def format(self, model: AssetAllocationModel, full: bool = False):
+        """ Returns the HTML document for the aa model """
+        output = io.StringIO()
+        self.write(model, output, full)
+        return output.getvalue()
+
+    def write(self, model: AssetAllocationModel, stream: TextIO, full: bool = False):
+        """ Writes the HTML document to the text stream, row by row """
+        self.full = full
+
+        headers = ""
+        for name in self.columns:
+            if not self.full and name == "loc.cur.":
+                # Skip local currency if not displaying stocks.
+                continue
+            headers += f"<th>{escape(name)}</th>"
+
+        stream.write(self.page_start.substitute(
+            currency=escape(str(model.currency)), total=f"{model.total_amount:,.2f}",
+            headers=headers))
+
+        for row in ModelMapper(model).iterate_linear(self.full):
+            stream.write(self.__format_row(row))
+
+        stream.write(self.page_end.substitute())
+
+    def __format_row(self, row: AssetAllocationViewModel) -> str:
+        """ One table row """
+        cells = ""
+
+        # Set Allocation
+        value = ""
+        if row.set_allocation > 0:
+            value = f"{row.set_allocation:.2f}"
+        cells += self.__num_cell(value)
+
+        # Current Allocation
+        value = ""
+        if row.curr_allocation > Decimal(0):
+            value = f"{row.curr_allocation:.2f}"
+        cells += self.__num_cell(value)
+
+        # Allocation difference, percentage. Colored when over the threshold.
+        value = ""
+        if row.alloc_diff_perc.copy_abs() > Decimal(0):
+            value = f"{row.alloc_diff_perc:.0f} %"
+        drift_class = self.__get_drift_class(row)
+        cells += self.__num_cell(value, drift_class)
+
+        # Allocated value
+        value = ""
+        if row.set_value:
+            value = f"{row.set_value:,.0f}"
+        cells += self.__num_cell(value)
+
+        # Current Value
+        value = ""
+        if row.curr_value is not None:
+            value = f"{row.curr_value:,.0f}"
+        cells += self.__num_cell(value)
+
+        # Value in security's currency. Show only if displaying full model, with stocks.
+        if self.full:
+            value = ""
+            if row.curr_value_own_currency:
+                value = f"({row.curr_value_own_currency:,.0f} {row.own_currency})"
+            cells += self.__num_cell(value)
+
+        # Value diff
+        value = ""
+        if row.diff_value:
+            value = f"{row.diff_value:,.0f}"
+        cells += self.__num_cell(value, drift_class)
+
+        # Only the holdings have own currency.
+        return self.row.substitute(
+            row_class="stock-row" if row.own_currency else "class-row",
+            depth=row.depth, indent=row.depth * 1.5,
+            name=escape(str(row.name)), cells=cells)
+
+    def __get_drift_class(self, row: AssetAllocationViewModel) -> str:
+        """ over/under when the allocation difference reaches the drift threshold """
+        if row.alloc_diff_perc.copy_abs() >= self.drift_threshold:
+            return "over" if row.alloc_diff_perc > 0 else "under"
+        return ""
+
+    def __num_cell(self, text: str, css_class: str = "") -> str:
+        """ Right-aligned table cell """
+        return f'<td class="num {css_class}">{escape(text)}</td>'
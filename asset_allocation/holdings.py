@@ -0,0 +1,127 @@
+"""
+Columnar holdings engine.
+Keeps the holdings as parallel columns of scaled integers and calculates the values
+for all the holdings at once. Uses NumPy when available.
+The scaled integers are exact, so the results are identical to the Decimal calculation.
+"""
+from decimal import Decimal
+from typing import Dict, List
+
+try: import numpy
+except ImportError: numpy = None
+
+from .model import CashBalance
+
+# Largest product that is safe to calculate in 64-bit integers.
+INT64_LIMIT = 2 ** 63 - 1
+
+
+class ScaledColumn:
+    """
+    A column of decimal numbers stored as integers with a common power-of-ten scale.
+    value = integer * 10 ** -exponent
+    The values must be finite numbers.
+    """
+    def __init__(self, values: List[Decimal]):
+        # The smallest exponent that represents all the values exactly.
+        self.exponent = 0
+        for value in values:
+            if not isinstance(value, Decimal) or not value.is_finite():
+                raise ValueError(f"{value} is not a finite decimal number")
+            value_exponent = -value.as_tuple().exponent
+            if value_exponent > self.exponent:
+                self.exponent = value_exponent
+
+        self.integers: List[int] = [int(value.scaleb(self.exponent)) for value in values]
+
+    @property
+    def max_abs(self) -> int:
+        """ The largest absolute integer in the column """
+        return max((abs(value) for value in self.integers), default=0)
+
+
+class HoldingsTable:
+    """
+    Holdings as parallel columns: symbols, quantities, prices, currencies and exchange rates.
+    The stock objects in the model are updated with the calculated values.
+    """
+    def __init__(self, stocks: List, rates: Dict[str, Decimal], base_currency: str):
+        self.stocks = stocks
+        self.symbols: List[str] = [stock.symbol for stock in stocks]
+        self.currencies: List[str] = [stock.currency for stock in stocks]
+
+        quantities = []
+        prices = []
+        for stock in stocks:
+            if isinstance(stock, CashBalance):
+                # Cash balances only have the value.
+                quantities.append(self.__check(stock, "value", stock.value))
+                prices.append(Decimal(1))
+            else:
+                quantities.append(self.__check(stock, "quantity", stock.quantity))
+                prices.append(self.__check(stock, "price", stock.price))
+
+        fx_rates = []
+        for currency in self.currencies:
+            if currency == base_currency:
+                fx_rates.append(Decimal(1))
+            elif currency in rates:
+                fx_rates.append(rates[currency])
+            else:
+                raise ValueError(f"No rate found for {currency}!")
+
+        self.quantities = ScaledColumn(quantities)
+        self.prices = ScaledColumn(prices)
+        self.fx_rates = ScaledColumn(fx_rates)
+
+        # Results, as scaled integers.
+        self.values: List[int] = None
+        self.values_in_base: List[int] = None
+
+    def calculate(self):
+        """ Calculates the value and the value in base currency for all the holdings """
+        self.values = self.__multiply(self.quantities.integers, self.prices.integers,
+                                      self.quantities.max_abs * self.prices.max_abs)
+        self.values_in_base = self.__multiply(
+            self.values, self.fx_rates.integers,
+            self.quantities.max_abs * self.prices.max_abs * self.fx_rates.max_abs)
+
+    @property
+    def value_exponent(self) -> int:
+        """ Scale of the values in own currency """
+        return self.quantities.exponent + self.prices.exponent
+
+    @property
+    def base_value_exponent(self) -> int:
+        """ Scale of the values in base currency """
+        return self.value_exponent + self.fx_rates.exponent
+
+    def get_total_in_base(self) -> Decimal:
+        """ The sum of all the holdings in base currency """
+        return Decimal(sum(self.values_in_base)).scaleb(-self.base_value_exponent)
+
+    def apply(self):
+        """ Stores the values in base currency on the stock objects """
+        exponent = self.base_value_exponent
+        for stock, value in zip(self.stocks, self.values_in_base):
+            stock.value_in_base_currency = Decimal(value).scaleb(-exponent)
+
+    def __check(self, stock, name: str, value) -> Decimal:
+        """ The value, if it can be calculated with """
+        if isinstance(value, int):
+            value = Decimal(value)
+        if not isinstance(value, Decimal) or not value.is_finite():
+            raise ValueError(f"Invalid {name} for {stock.symbol}: {value}")
+        return value
+
+    def __multiply(self, left: List[int], right: List[int], max_product: int) -> List[int]:
+        """ Element-wise product. Uses 64-bit integers when the products fit. """
+        if numpy is None:
+            return [a * b for a, b in zip(left, right)]
+
+        if max_product <= INT64_LIMIT:
+            result = numpy.array(left, dtype=numpy.int64) * numpy.array(right, dtype=numpy.int64)
+        else:
+            # Python integers, to avoid the overflow.
+            result = numpy.array(left, dtype=object) * numpy.array(right, dtype=object)
+        return result.tolist()
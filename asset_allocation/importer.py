@@ -0,0 +1,244 @@
+"""
+Bulk import of records from .csv files.
+The file is read as a stream and the rows are written in batches, with parameterized
+statements, in a single transaction. Nothing is written if any row is invalid.
+A dry run executes the same statements and rolls the transaction back.
+The first row must contain the column names.
+"""
+import csv
+from decimal import Decimal, InvalidOperation
+from typing import Dict, List
+
+from sqlalchemy import Float, Integer, String, and_, bindparam, tuple_
+from sqlalchemy.exc import DBAPIError
+
+BATCH_SIZE = 1000
+# Bound parameters per key lookup. Older SQLite versions allow at most 999.
+MAX_KEY_PARAMETERS = 500
+
+
+class RowError:
+    """ A problem with one line of the file """
+    def __init__(self, line: int, message: str):
+        self.line = line
+        self.message = message
+
+    def __repr__(self):
+        return f"<RowError (line {self.line}: {self.message})>"
+
+
+class ImportReport:
+    """ The outcome of an import """
+    def __init__(self):
+        self.rows_read = 0
+        self.inserted = 0
+        self.updated = 0
+        self.dry_run = False
+        self.errors: List[RowError] = []
+
+    @property
+    def is_valid(self) -> bool:
+        """ The import succeeded (or would succeed) if there are no errors """
+        return not self.errors
+
+    def add_error(self, line: int, message: str):
+        """ Records an error """
+        self.errors.append(RowError(line, message))
+
+    def format(self) -> str:
+        """ Text report """
+        if not self.is_valid:
+            output = f"Import failed. No data saved. {len(self.errors)} error(s) found:\n"
+            for error in self.errors:
+                output += f"  line {error.line}: {error.message}\n"
+            return output
+
+        if self.dry_run:
+            return (f"Dry run. {self.rows_read} rows are valid. {self.inserted} rows would be "
+                    f"created, {self.updated} updated.")
+        return f"Data imported. {self.inserted} rows created, {self.updated} updated."
+
+
+class CsvImporter:
+    """
+    Imports the rows of a .csv file into a table.
+    With upsert, the rows that match an existing record on the key column(s) update
+    the record instead of creating a new one.
+    """
+    def __init__(self, session, entity, key, batch_size: int = BATCH_SIZE):
+        self.session = session
+        self.table = entity.__table__
+        # The column, or the tuple of columns, that identifies existing records in upsert mode.
+        self.key_columns = (key,) if isinstance(key, str) else tuple(key)
+        self.batch_size = batch_size
+        self.upsert = False
+        self.dry_run = False
+        self.report: ImportReport = None
+        # Keys of the records created in this import, for upsert.
+        self.imported_keys = set()
+
+    def import_file(self, file_path: str) -> ImportReport:
+        """ Reads the file and saves the records. Returns the report. """
+        with open(file_path, newline="") as csv_file:
+            return self.import_rows(csv_file)
+
+    def import_rows(self, lines) -> ImportReport:
+        """ Imports from any iterable of csv lines, i.e. an open file """
+        self.report = ImportReport()
+        self.report.dry_run = self.dry_run
+        self.imported_keys = set()
+
+        reader = csv.reader(lines, skipinitialspace=True)
+        header = next(reader, None)
+        if not header or not self.__validate_header(header):
+            if not header:
+                self.report.add_error(1, "The file is empty.")
+            return self.report
+
+        batch = []
+        for values in reader:
+            if not values:
+                continue
+            self.report.rows_read += 1
+            row = self.__parse_row(reader.line_num, header, values)
+            if row is None:
+                continue
+            batch.append((reader.line_num, row))
+            if len(batch) >= self.batch_size:
+                self.__write_batch(batch)
+                batch = []
+        if batch:
+            self.__write_batch(batch)
+
+        if self.dry_run or not self.report.is_valid:
+            self.session.rollback()
+        else:
+            self.session.commit()
+        return self.report
+
+    def __validate_header(self, header: List[str]) -> bool:
+        """ All the columns must exist in the table """
+        valid = True
+        for name in header:
+            if name not in self.table.c:
+                self.report.add_error(1, f"Unknown column {name} for {self.table.name}.")
+                valid = False
+        for name in self.key_columns:
+            if self.upsert and name not in header:
+                self.report.add_error(1, f"The key column {name} is required for upsert.")
+                valid = False
+        return valid
+
+    def __parse_row(self, line: int, header: List[str], values: List[str]) -> Dict:
+        """ Converts the values to the column types. Returns None if the row is invalid. """
+        if len(values) != len(header):
+            self.report.add_error(line, f"Expected {len(header)} values, found {len(values)}.")
+            return None
+
+        row = {}
+        for name, text in zip(header, values):
+            column = self.table.c[name]
+            text = self.__unquote(text.strip())
+            if text == "" or text.upper() == "NULL":
+                if not column.nullable and not column.primary_key:
+                    self.report.add_error(line, f"{name} is required.")
+                    return None
+                row[name] = None
+                continue
+            try:
+                row[name] = self.__convert(column, text)
+            except (ValueError, InvalidOperation):
+                self.report.add_error(line, f"Invalid value for {name}: {text}")
+                return None
+        return row
+
+    def __unquote(self, text: str) -> str:
+        """ The files for the former SQL-based import quote the texts with apostrophes """
+        if len(text) > 1 and text[0] == "'" and text[-1] == "'":
+            return text[1:-1]
+        return text
+
+    def __convert(self, column, text: str):
+        """ Converts the text to the column type """
+        if isinstance(column.type, Integer):
+            return int(text)
+        if isinstance(column.type, Float):
+            return Decimal(text)
+        if isinstance(column.type, String) and column.type.length \
+                and len(text) > column.type.length:
+            raise ValueError(f"longer than {column.type.length} characters")
+        return text
+
+    def __write_batch(self, batch: List[tuple]):
+        """ Inserts/updates the rows with one statement execution per kind """
+        if not self.report.is_valid:
+            # Nothing will be saved. Only validate the rest of the file.
+            return
+
+        rows = [row for _, row in batch]
+        to_update = []
+        if self.upsert:
+            existing = self.__get_existing_keys([self.__get_key(row) for row in rows])
+            # Keys repeated in the file update the record created by the first occurrence.
+            existing.update(self.imported_keys)
+            to_insert = []
+            for row in rows:
+                key = self.__get_key(row)
+                if key in existing:
+                    to_update.append(row)
+                else:
+                    to_insert.append(row)
+                    existing.add(key)
+                    self.imported_keys.add(key)
+            rows = to_insert
+
+        self.report.inserted += len(rows)
+        self.report.updated += len(to_update)
+
+        # Also in a dry run, to find the rows that the database would reject.
+        # The transaction is rolled back at the end.
+        try:
+            if rows:
+                self.session.execute(self.table.insert(), rows)
+            if to_update and set(to_update[0]) - set(self.key_columns):
+                # Only when there is something besides the key to update.
+                self.session.execute(self.__get_update_statement(to_update[0]),
+                                     [self.__get_update_params(row) for row in to_update])
+        except DBAPIError as error:
+            first_line, last_line = batch[0][0], batch[-1][0]
+            self.report.add_error(first_line,
+                                  f"Lines {first_line}-{last_line} not saved: {error.orig}")
+
+    def __get_key(self, row: Dict) -> tuple:
+        """ The values of the key columns """
+        return tuple(row[name] for name in self.key_columns)
+
+    def __get_existing_keys(self, keys: List[tuple]) -> set:
+        """ The keys, of the given ones, that already exist in the table """
+        columns = [self.table.c[name] for name in self.key_columns]
+        if len(columns) == 1:
+            condition = columns[0].in_
+            keys = [key for (key,) in keys]
+        else:
+            condition = tuple_(*columns).in_
+        chunk_size = MAX_KEY_PARAMETERS // len(columns)
+
+        result = set()
+        for index in range(0, len(keys), chunk_size):
+            query = (
+                self.table.select().with_only_columns(columns)
+                .where(condition(keys[index:index + chunk_size]))
+            )
+            result.update(tuple(row) for row in self.session.execute(query))
+        return result
+
+    def __get_update_statement(self, row: Dict):
+        """ Updates the columns in the row, matching on the key """
+        values = {name: bindparam("b_" + name) for name in row if name not in self.key_columns}
+        condition = and_(*(self.table.c[name] == bindparam("b_" + name)
+                           for name in self.key_columns))
+        return self.table.update().where(condition).values(values)
+
+    def __get_update_params(self, row: Dict) -> Dict:
+        """ Bind parameters for the update statement """
+        return {"b_" + name: value for name, value in row.items()}
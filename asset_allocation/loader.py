@@ -1,14 +1,13 @@
 """ Asset Allocation loader """
 from decimal import Decimal
-from logging import DEBUG, log
+from logging import DEBUG, WARNING, log
 from typing import List
 
-from gnucash_portfolio.bookaggregate import BookAggregate
 from piecash import Account, Book, Commodity, open_book
 from pricedb.model import PriceModel
 
-from . import dal
-from .config import Config, ConfigKeys
+from . import dal, profiling
+from .config import Config, ConfigKeys, get_config
 from .maps import AssetClassMapper
 from .model import AssetAllocationModel, AssetClass, Stock, CashBalance
 from .stocks import StocksInfo
@@ -23,11 +22,49 @@ class AssetAllocationLoader:
         self.mapper = None
         self.model: AssetAllocationModel = None
         self.logger = None
+        self.currency_converter: CurrencyConverter = None
+        # Parsed security symbols, by symbol.
+        self.security_symbols = {}
         # Base currency is just an ISO symbol (i.e. "EUR")
         self.base_currency = base_currency
 
+    @profiling.profiled("load_cash_balances")
     def load_cash_balances(self):
         """ Loads cash balances from GnuCash book and recalculates into the default currency """
+        cash_balances = self.__read_cash_balances()
+
+        # Treat each sum per currency as a Stock, for display in full mode.
+        self.__store_cash_balances_per_currency(cash_balances)
+
+        # Total in base currency.
+        # cash_balance = self.__get_cash_balance_in_base_currency(cash_balances)
+
+        # assign to cash asset class.
+        # cash = self.model.get_cash_asset_class()
+        # cash.curr_value = cash_balance
+
+    @profiling.profiled("load_holdings_concurrently")
+    def load_holdings_concurrently(self):
+        """
+        Loads quantities, cash balances and prices in parallel.
+        The GnuCash book and the price database are separate files, so the reads
+        do not depend on each other. The model is updated once all the reads are done,
+        as the reads iterate over the model's stocks.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            quantities = executor.submit(self.__read_stock_quantities)
+            cash_balances = executor.submit(self.__read_cash_balances)
+            prices = executor.submit(self.__read_prices_and_rates)
+            results = (quantities.result(), cash_balances.result(), prices.result())
+
+        self.__assign_quantities(results[0])
+        self.__store_cash_balances_per_currency(results[1])
+        self.__assign_prices(results[2])
+
+    def __read_cash_balances(self):
+        """ Reads the cash balances per currency from the GnuCash book """
         from gnucash_portfolio.accounts import AccountsAggregate, AccountAggregate
 
         cfg = self.__get_config()
@@ -39,16 +76,8 @@ class AssetAllocationLoader:
             root_account = svc.get_by_fullname(cash_root_name)
             acct_svc = AccountAggregate(book, root_account)
             cash_balances = acct_svc.load_cash_balances_with_children(cash_root_name)
-
-        # Treat each sum per currency as a Stock, for display in full mode.
-        self.__store_cash_balances_per_currency(cash_balances)
-
-        # Total in base currency.
-        # cash_balance = self.__get_cash_balance_in_base_currency(cash_balances)
-
-        # assign to cash asset class.
-        # cash = self.model.get_cash_asset_class()
-        # cash.curr_value = cash_balance
+        profiling.add_rows(len(cash_balances))
+        return cash_balances
 
     def __store_cash_balances_per_currency(self, cash_balances):
         """ Store balance per currency as Stock records under Cash class """
@@ -64,10 +93,15 @@ class AssetAllocationLoader:
 
             # self.logger.debug(f"adding {item}")
             cash.stocks.append(item)
-            self.model.stocks.append(item)
-
-    def load_tree_from_db(self) -> AssetAllocationModel:
-        """ Reads the asset allocation data only, and constructs the AA tree """
+            self.model.add_stock(item)
+
+    @profiling.profiled("load_tree")
+    def load_tree_from_db(self, single_query: bool = True) -> AssetAllocationModel:
+        """
+        Reads the asset allocation data only, and constructs the AA tree.
+        By default, all the asset classes are read with one query and the tree is
+        built in memory. Set single_query to False to load the children per node.
+        """
         self.model = AssetAllocationModel()
 
         # currency
@@ -75,6 +109,10 @@ class AssetAllocationLoader:
 
         # Asset Classes
         db = self.__get_session()
+        if single_query:
+            self.__load_all_classes(db)
+            return self.model
+
         first_level = (
             db.query(dal.AssetClass)
             .filter(dal.AssetClass.parentid == None)
@@ -87,16 +125,18 @@ class AssetAllocationLoader:
             ac = self.__map_entity(entity)
             self.model.classes.append(ac)
             # Add to index
-            self.model.asset_classes.append(ac)
+            self.model.add_asset_class(ac)
 
             # append child classes recursively
             self.__load_child_classes(ac)
 
         return self.model
 
+    @profiling.profiled("load_stock_links")
     def load_stock_links(self):
         """ Read stock links into the model """
         links = self.__get_session().query(dal.AssetClassStock).all()
+        profiling.add_rows(len(links))
         for entity in links:
             # log(DEBUG, f"adding {entity.symbol} to {entity.assetclassid}")
             # mapping
@@ -105,52 +145,177 @@ class AssetAllocationLoader:
             parent: AssetClass = self.model.get_class_by_id(entity.assetclassid)
             if parent:
                 # Assign to parent.
+                stock.parent = parent
                 parent.stocks.append(stock)
                 # Add to index for easy reference
-                self.model.stocks.append(stock)
+                self.model.add_stock(stock)
+            else:
+                log(WARNING, "Asset class %s not found for %s", entity.assetclassid, entity.symbol)
+                self.model.missing_class_links.append((entity.symbol, entity.assetclassid))
+
+    @profiling.profiled("load_quantities")
+    def load_stock_quantity(self, batched: bool = True):
+        """
+        Loads quantities for all stocks.
+        By default, all the quantities are read in one pass through the book.
+        """
+        if batched:
+            self.__assign_quantities(self.__read_stock_quantities())
+            return
 
-    def load_stock_quantity(self):
-        """ Loads quantities for all stocks """
         info = StocksInfo(self.config)
         for stock in self.model.stocks:
-            stock.quantity = info.load_stock_quantity(stock.symbol)
+            with profiling.stage("quantity", symbol=stock.symbol):
+                stock.quantity = info.load_stock_quantity(stock.symbol)
         info.gc_book.close()
 
-    def load_stock_prices(self):
-        """ Load latest prices for securities """
-        from pricedb import SecuritySymbol
+    @profiling.profiled("load_prices")
+    def load_stock_prices(self, batched: bool = True):
+        """
+        Load latest prices for securities.
+        By default, the prices for all the securities are fetched with one query.
+        """
+        prices = self.__read_stock_prices(batched)
+        self.__assign_prices(prices)
+
+    @profiling.profiled("refresh_prices")
+    def refresh_prices(self) -> AssetAllocationModel:
+        """
+        Reloads the prices and exchange rates for the already loaded model and
+        recalculates the values. The tree, the stock links and the quantities are kept.
+        """
+        conv = self.__get_currency_converter()
+        conv.invalidate()
+
+        prices = self.__read_stock_prices()
+        self.__assign_prices(prices)
+        self.recalculate_stock_values_into_base()
+
+        self.model.recalculate()
+        return self.model
+
+    def close_databases(self):
+        """
+        Releases the database connections. The loader can still be used; the
+        connections are opened again when needed.
+        """
+        if self.session:
+            self.session.close()
+        if self.currency_converter:
+            self.currency_converter.close_database()
+
+    def __read_stock_quantities(self):
+        """ Reads the quantities for all the linked symbols from the book """
+        info = StocksInfo(self.config)
+        symbols = list({stock.symbol for stock in self.model.stocks})
+        quantities = info.load_stock_quantities(symbols)
+        info.close_databases()
+        profiling.add_rows(len(quantities))
+        return quantities
+
+    def __assign_quantities(self, quantities):
+        """ Sets the quantities on the stocks """
+        for stock in self.model.stocks:
+            stock.quantity = quantities[stock.symbol]
 
+    def __read_stock_prices(self, batched: bool = True):
+        """ Reads the latest prices for all the securities. Returns prices by symbol. """
         info = StocksInfo(self.config)
+        symbols = self.__get_security_symbols()
+
+        result = {}
+        if batched:
+            prices = info.load_latest_prices(list(symbols.values()))
+            for key, symbol in symbols.items():
+                result[key] = prices.get((symbol.namespace, symbol.mnemonic))
+        else:
+            for key, symbol in symbols.items():
+                with profiling.stage("price", symbol=key):
+                    result[key] = info.load_latest_price(symbol)
+        info.close_databases()
+        profiling.add_rows(sum(1 for price in result.values() if price))
+        return result
+
+    def __get_security_symbols(self):
+        """
+        Parsed symbols of all the stocks, by symbol. Kept for subsequent price reads.
+        Cash balances have no price.
+        """
+        from pricedb import SecuritySymbol
+
         for item in self.model.stocks:
+            if not isinstance(item, Stock) or item.symbol in self.security_symbols:
+                continue
             symbol = SecuritySymbol("", "")
             symbol.parse(item.symbol)
-
-            price: PriceModel = info.load_latest_price(symbol)
+            self.security_symbols[item.symbol] = symbol
+
+        return self.security_symbols
+
+    def __read_prices_and_rates(self):
+        """ Reads the prices and the exchange rates for their currencies """
+        prices = self.__read_stock_prices()
+
+        currencies = [price.currency for price in prices.values()
+                      if price and price.currency != self.base_currency]
+        conv = self.__get_currency_converter()
+        conv.load_currencies(currencies)
+        # Release the connection so that the converter can be used from other threads.
+        conv.close_database()
+
+        return prices
+
+    def __assign_prices(self, prices):
+        """
+        Sets the prices on the stocks. Uses a dummy price for the missing ones.
+        Cash balances are left without a price, whether they are loaded before or after
+        the prices.
+        """
+        self.model.unpriced_symbols = []
+        for item in self.model.stocks:
+            if not isinstance(item, Stock):
+                continue
+            price: PriceModel = prices.get(item.symbol)
             if not price:
+                self.model.unpriced_symbols.append(item.symbol)
                 # Use a dummy price of 1, effectively keeping the original amount.
                 price = PriceModel()
-                price.currency = self.config.get(ConfigKeys.default_currency)
+                price.currency = self.__get_config().get(ConfigKeys.default_currency)
                 price.value = Decimal(1)
             item.price = price.value
-            if isinstance(item, Stock):
-                item.currency = price.currency
-                # Do not set currency for Cash balance records.
-        info.close_databases()
+            item.currency = price.currency
 
-    def recalculate_stock_values_into_base(self):
+    @profiling.profiled("recalculate_into_base")
+    def recalculate_stock_values_into_base(self, columnar: bool = False):
         """ Loads the exchange rates and recalculates stock holding values into 
-        base currency """
-        from .currency import CurrencyConverter
-
-        conv = CurrencyConverter()
+        base currency.
+        With columnar, all the values are calculated at once in the holdings table. """
+        conv = self.__get_currency_converter()
         cash = self.model.get_cash_asset_class()
+        profiling.add_rows(len(self.model.stocks))
+
+        # Load the rates for all the currencies at once.
+        currencies = [stock.currency for stock in self.model.stocks
+                      if stock.currency != self.base_currency]
+        conv.load_currencies(currencies)
+        # Keep the rates with the model, i.e. for the currencies of the securities not held.
+        self.model.exchange_rates = {mnemonic: rate.value for mnemonic, rate in conv.rates.items()}
+
+        if columnar:
+            from .holdings import HoldingsTable
+
+            table = HoldingsTable(self.model.stocks, self.model.exchange_rates, self.base_currency)
+            table.calculate()
+            table.apply()
+            return
 
         for stock in self.model.stocks:
             if stock.currency != self.base_currency:
                 # Recalculate into base currency
-                conv.load_currency(stock.currency)
-                assert isinstance(stock.value, Decimal)
-                val_base = stock.value * conv.rate.value
+                with profiling.stage("convert", symbol=stock.symbol, currency=stock.currency):
+                    conv.load_currency(stock.currency)
+                    assert isinstance(stock.value, Decimal)
+                    val_base = stock.value * conv.rate.value
             else:
                 # Already in base currency.
                 val_base = stock.value
@@ -171,14 +336,74 @@ class AssetAllocationLoader:
         # map
         for entity in entities:
             child_ac = self.__map_entity(entity)
+            child_ac.parent = ac
             # depth
             child_ac.depth = ac.depth + 1
             ac.classes.append(child_ac)
             # Add to index
-            self.model.asset_classes.append(child_ac)
+            self.model.add_asset_class(child_ac)
 
             self.__load_child_classes(child_ac)
 
+    def __load_all_classes(self, db):
+        """
+        Reads all the asset classes in one query and builds the tree from the
+        parent id -> children map. Classes that can not be reached from the root
+        are not added to the tree but recorded in the model.
+        """
+        entities = (
+            db.query(dal.AssetClass)
+            .order_by(dal.AssetClass.sortorder)
+            .all()
+        )
+        profiling.add_rows(len(entities))
+
+        by_id = {}
+        # parent id -> child entities, in sort order.
+        children = {}
+        for entity in entities:
+            by_id[entity.id] = entity
+            children.setdefault(entity.parentid, []).append(entity)
+
+        # Walk the tree from the first level, depth-first, in sort order.
+        reached = set()
+        stack = [(entity, None) for entity in reversed(children.get(None, []))]
+        while stack:
+            entity, parent = stack.pop()
+            reached.add(entity.id)
+
+            ac = self.__map_entity(entity)
+            if parent:
+                ac.parent = parent
+                ac.depth = parent.depth + 1
+                parent.classes.append(ac)
+            else:
+                self.model.classes.append(ac)
+            # Add to index
+            self.model.add_asset_class(ac)
+
+            for child in reversed(children.get(entity.id, [])):
+                stack.append((child, ac))
+
+        # Anything not reached either hangs off a missing parent or is in a cycle.
+        for entity in entities:
+            if entity.id in reached:
+                continue
+
+            visited = set()
+            cursor = entity
+            while cursor is not None and cursor.id not in visited:
+                visited.add(cursor.id)
+                cursor = by_id.get(cursor.parentid)
+
+            if cursor is None:
+                log(WARNING, "Orphaned asset class %s (parent %s not found)",
+                    entity.id, entity.parentid)
+                self.model.orphaned_class_ids.append(entity.id)
+            else:
+                log(WARNING, "Asset class %s is in a parent cycle", entity.id)
+                self.model.cyclic_class_ids.append(entity.id)
+
     def __map_entity(self, entity: dal.AssetClass) -> AssetClass:
         """ maps the entity onto the model object """
         mapper = self.__get_mapper()
@@ -192,15 +417,22 @@ class AssetAllocationLoader:
         return self.mapper
 
     def __get_session(self):
-        """ Opens a db session """
-        db_path = self.__get_config().get(ConfigKeys.asset_allocation_database_path)
-        self.session = dal.get_session(db_path)
+        """ Opens a db session, or reuses the open one """
+        if not self.session:
+            db_path = self.__get_config().get(ConfigKeys.asset_allocation_database_path)
+            self.session = dal.get_session(db_path)
         return self.session
 
+    def __get_currency_converter(self) -> CurrencyConverter:
+        """ The currency converter keeps the rates between recalculations """
+        if not self.currency_converter:
+            self.currency_converter = CurrencyConverter()
+        return self.currency_converter
+
     def __get_config(self):
         """ returns/creates a config object """
         if not self.config:
-            self.config = Config()
+            self.config = get_config()
         return self.config
 
     def __load_asset_class(self, ac_id: int):
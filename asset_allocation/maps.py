@@ -35,31 +35,39 @@ class ModelMapper():
 
     def map_to_linear(self, with_stocks: bool=False):
         """ Maps the tree to a linear representation suitable for display """
-        result = []
-
-        for ac in self.model.classes:
-            rows = self.__get_ac_tree(ac, with_stocks)
-            result += rows
-        return result
-
-    def __get_ac_tree(self, ac: model.AssetClass, with_stocks: bool):
-        """ formats the ac tree - entity with child elements """
-        output = []
-        output.append(self.__get_ac_row(ac))
-
-        for child in ac.classes:
-            output += self.__get_ac_tree(child, with_stocks)
-
-        if with_stocks:
-            for stock in ac.stocks:
-                row = None
-                if isinstance(stock, Stock):
-                    row = self.__get_stock_row(stock, ac.depth + 1)
-                elif isinstance(stock, CashBalance):
-                    row = self.__get_cash_row(stock, ac.depth + 1)
-                output.append(row)
-
-        return output
+        return list(self.iterate_linear(with_stocks))
+
+    def iterate_linear(self, with_stocks: bool=False):
+        """
+        Yields the display rows one at a time, in the same order as map_to_linear:
+        each asset class, then its child classes, then its stocks.
+        """
+        # Pending work: asset classes to output, or classes whose stocks are still due.
+        stack = [(ac, False) for ac in reversed(self.model.classes)]
+        while stack:
+            ac, stocks_due = stack.pop()
+
+            if stocks_due:
+                for stock in ac.stocks:
+                    yield self.__get_holding_row(stock, ac.depth + 1)
+                continue
+
+            yield self.__get_ac_row(ac)
+
+            if with_stocks and ac.stocks:
+                # The stocks follow all the child classes.
+                stack.append((ac, True))
+            for child in reversed(ac.classes):
+                stack.append((child, False))
+
+    def __get_holding_row(self, stock, depth: int) -> AssetAllocationViewModel:
+        """ formats a stock or cash balance row """
+        row = None
+        if isinstance(stock, Stock):
+            row = self.__get_stock_row(stock, depth)
+        elif isinstance(stock, CashBalance):
+            row = self.__get_cash_row(stock, depth)
+        return row
 
     def __get_ac_row(self, ac: model.AssetClass) -> AssetAllocationViewModel:
         """ Formats one Asset Class record """
@@ -6,7 +6,7 @@ import logging
 from decimal import Decimal
 from logging import DEBUG, log
 from os import path
-from typing import List
+from typing import Dict, List
 
 try: import simplejson as json
 except ImportError: import json
@@ -14,10 +14,19 @@ except ImportError: import json
 
 class _AssetBase:
     """Base class for asset group & class"""
+    # Slots instead of the instance dictionary, to keep large trees compact.
+    __slots__ = ("parent_id", "__parent", "__fullname", "model", "name", "allocation",
+                 "curr_alloc", "alloc_value", "curr_value", "threshold", "over_threshold",
+                 "under_threshold", "sort_order", "depth")
+
     def __init__(self):
         # reference to parent object
         self.parent_id = None
-        self.parent: AssetClass = None
+        self.__parent: AssetClass = None
+        # Cached full path. Cleared when the node is re-parented.
+        self.__fullname: str = None
+        # The model that indexes the class. Set by add_asset_class.
+        self.model: AssetAllocationModel = None
 
         self.name = None
         # Set allocation %.
@@ -64,21 +73,38 @@ class _AssetBase:
         return self.curr_value - self.alloc_value
 
     @property
-    def fullname(self):
-        """ includes the full path with parent names """
-        prefix = ""
-        if self.parent:
-            if self.parent.fullname:
-                prefix = self.parent.fullname + ":"
-        else:
-            # Only the root does not have a parent. In that case we also don't need a name.
-            return ""
+    def parent(self):
+        """ The parent asset class """
+        return self.__parent
+
+    @parent.setter
+    def parent(self, value):
+        """ Re-parenting changes the path of the whole branch """
+        self.__parent = value
+        self.invalidate_path()
 
-        return prefix + self.name
+    @property
+    def fullname(self):
+        """ includes the full path with parent names. i.e. Equity:International """
+        if self.__fullname is None:
+            if self.parent:
+                self.__fullname = self.parent.fullname + ":" + self.name
+            else:
+                # First-level classes have no parent.
+                self.__fullname = self.name
+        return self.__fullname
+
+    def invalidate_path(self):
+        """ Clears the cached path. Call after renaming the node. """
+        self.__fullname = None
+        if self.model:
+            self.model.invalidate_tree()
 
 
 class CashBalance:
     """ Similar to Stock but keeps track of cash balance per currency """
+    __slots__ = ("symbol", "currency", "value", "value_in_base_currency", "parent", "price")
+
     def __init__(self, symbol: str):
         self.symbol: str = symbol
         # Own currency
@@ -87,6 +113,10 @@ class CashBalance:
         self.value: Decimal = None
         # Value in base currency
         self.value_in_base_currency: Decimal = None
+        # The Cash asset class
+        self.parent: AssetClass = None
+        # Price (last known). Not used for the value.
+        self.price: Decimal = None
 
     def __repr__(self):
         return f"<Cash (symbol='{self.symbol}',value={self.value} {self.currency},({self.value_in_base_currency}))>"
@@ -94,6 +124,9 @@ class CashBalance:
 
 class Stock:
     """Stock link"""
+    __slots__ = ("symbol", "quantity", "price", "currency", "__parent", "__asset_class",
+                 "value_in_base_currency", "curr_alloc")
+
     def __init__(self, symbol: str):
         self.symbol: str = symbol
         # Quantity (number of shares)
@@ -103,7 +136,9 @@ class Stock:
         # Currency symbol for the price
         self.currency: str = None
         # Parent class
-        self.parent: AssetClass = None
+        self.__parent: AssetClass = None
+        # Cached asset class path. Cleared when the stock is re-parented.
+        self.__asset_class: str = None
         # Value in base currency. Calculated externally.
         self.value_in_base_currency: Decimal = None
         # Current allocation
@@ -122,20 +157,36 @@ class Stock:
         
         return self.quantity * self.price
 
+    @property
+    def parent(self):
+        """ The asset class that holds the stock """
+        return self.__parent
+
+    @parent.setter
+    def parent(self, value):
+        self.__parent = value
+        self.invalidate_path()
+
     @property
     def asset_class(self) -> str:
         """ Returns the full asset class path for this stock """
-        result = self.parent.name if self.parent else ""
-        # Iterate to the top asset class and add names.
-        cursor = self.parent
-        while cursor:
-            result = cursor.name + ":" + result
-            cursor = cursor.parent
-        return result
+        if self.__asset_class is None:
+            self.__asset_class = self.parent.fullname if self.parent else ""
+        return self.__asset_class
+
+    def invalidate_path(self):
+        """ Clears the cached asset class path """
+        self.__asset_class = None
 
 
 class AssetClass(_AssetBase):
-    """Asset Class contains stocks """
+    """
+    Asset Class contains stocks.
+    Set the parent of the classes added to another class's children. The model's
+    lookups are rebuilt on the parent changes of the classes added to it.
+    """
+    __slots__ = ("id", "root_account", "classes", "stocks")
+
     def __init__(self):
         super().__init__()
 
@@ -161,6 +212,15 @@ class AssetClass(_AssetBase):
 
         return sum
 
+    def invalidate_path(self):
+        """ Clears the cached paths of the whole branch """
+        super().invalidate_path()
+        for child in self.classes:
+            child.invalidate_path()
+        for stock in self.stocks:
+            if isinstance(stock, Stock):
+                stock.invalidate_path()
+
     def __repr__(self):
         return f"<AssetClass (name='{self.name}',allocation='{self.allocation:.2f}')>"
 
@@ -179,52 +239,103 @@ class AssetAllocationModel:
         # Index of all Stocks
         self.stocks: List[Stock] = []
 
+        # Lookup indexes, maintained by add_asset_class and add_stock.
+        self.__class_by_id: Dict[int, AssetClass] = {}
+        self.__class_by_name: Dict[str, AssetClass] = {}
+        self.__stocks_by_symbol: Dict[str, List[Stock]] = {}
+        # Built on first use, as the full names depend on the parents.
+        self.__class_by_fullname: Dict[str, AssetClass] = None
+        # The flattened tree, for the calculations, and the parent positions in it.
+        # Built on first use.
+        self.__post_order: List[AssetClass] = None
+        self.__parent_index: List[int] = None
+        # Incremented on every change of the tree structure or the class paths.
+        # The versions the above were built for.
+        self.__tree_version = 0
+        self.__fullname_version: int = None
+        self.__post_order_version: int = None
+
+        # Ids of asset classes that could not be attached to the tree.
+        self.orphaned_class_ids: List[int] = []
+        self.cyclic_class_ids: List[int] = []
+        # Stock links to classes that do not exist. (symbol, asset class id)
+        self.missing_class_links: List[tuple] = []
+        # Symbols for which no price was found.
+        self.unpriced_symbols: List[str] = []
+        # Rates into the base currency, by currency, as used for the values.
+        self.exchange_rates: Dict[str, Decimal] = {}
+
+    def add_asset_class(self, ac: AssetClass):
+        """
+        Adds the asset class to the linear list and the indexes.
+        Call it also for the first-level classes appended to classes.
+        """
+        ac.model = self
+        self.asset_classes.append(ac)
+
+        if ac.id is not None:
+            self.__class_by_id[ac.id] = ac
+        if ac.name:
+            self.__class_by_name.setdefault(ac.name.lower(), ac)
+        self.invalidate_tree()
+
+    def add_stock(self, stock: Stock):
+        """ Adds the stock to the linear list and the symbol index """
+        self.stocks.append(stock)
+        self.__stocks_by_symbol.setdefault(stock.symbol, []).append(stock)
+        self.invalidate_tree()
+
     def get_class_by_id(self, ac_id: int) -> AssetClass:
         """ Finds the asset class by id """
         assert isinstance(ac_id, int)
 
-        # iterate recursively
-        for ac in self.asset_classes:
-            if ac.id == ac_id:
-                return ac
-        # if nothing returned so far.
-        return None
+        return self.__class_by_id.get(ac_id)
+
+    def get_class_by_name(self, name: str) -> AssetClass:
+        """ Finds the asset class by name, case-insensitive """
+        return self.__class_by_name.get(name.lower())
+
+    def get_class_by_fullname(self, fullname: str) -> AssetClass:
+        """ Finds the asset class by the full path. i.e. Equity:International """
+        if self.__fullname_version != self.__tree_version:
+            self.__class_by_fullname = {}
+            for ac in self.asset_classes:
+                self.__class_by_fullname.setdefault(ac.fullname, ac)
+            self.__fullname_version = self.__tree_version
+        return self.__class_by_fullname.get(fullname)
+
+    def get_stocks_by_symbol(self, symbol: str) -> List[Stock]:
+        """ Finds all the stock links for the symbol """
+        return self.__stocks_by_symbol.get(symbol, [])
 
     def get_cash_asset_class(self) -> AssetClass:
         """ Find the cash asset class by name. """
-        for ac in self.asset_classes:
-            if ac.name.lower() == "cash":
-                return ac
-        return None
+        return self.get_class_by_name("cash")
 
     def validate(self) -> bool:
-        """ Validate that the values match. Incomplete! """
-        # Asset class allocation should match the sum of children's allocations.
-        # Each group should be compared.
-        sum = Decimal(0)
+        """
+        Validate the model. All the issues found are logged.
+        Use ModelValidator directly to get the full report.
+        """
+        from .validation import ModelValidator
 
-        # Go through each asset class, not just the top level.
+        report = ModelValidator(self).validate()
+        for issue in report.issues:
+            self.logger.warning(issue.message)
+
+        return report.is_valid
+
+    def recalculate(self):
+        """
+        Recalculates the values and allocations from the stock values in base currency.
+        One bottom-up sweep for the values, then one pass for the set values and allocations.
+        """
+        self.calculate_current_value()
+
+        total = self.total_amount
         for ac in self.asset_classes:
-            if ac.classes:
-                # get the sum of all the children's allocations
-                child_alloc_sum = ac.child_allocation
-                # compare to set allocation
-                if ac.allocation != child_alloc_sum:
-                    message = f"The sum of child allocations {child_alloc_sum:.2f} invalid for {ac}!"
-                    self.logger.warning(message)
-                    print(message)
-                    return False
-
-        # also make sure that the sum of 1st level children matches 100
-        for ac in self.classes:
-            sum += ac.allocation
-        if sum != Decimal(100):
-            message = f"The sum of all allocations ({sum:.2f}) does not equal 100!"
-            self.logger.warning(message)
-            print(message)
-            return False
-
-        return True
+            ac.alloc_value = total * ac.allocation / Decimal(100)
+            ac.curr_alloc = ac.curr_value * 100 / total
 
     def calculate_set_values(self):
         """ Calculate the expected totals based on set allocations """
@@ -238,27 +349,54 @@ class AssetAllocationModel:
 
     def calculate_current_value(self):
         """ Add all the stock values and assign to the asset classes """
-        # must be recursive
+        order, parents = self.__get_flat_tree()
+        # Sums of the finished children, by position in the flattened tree.
+        children_values = [Decimal(0)] * len(order)
         total = Decimal(0)
-        for ac in self.classes:
-            self.__calculate_current_value(ac)
-            total += ac.curr_value
-        self.total_amount = total
-
-    def __calculate_current_value(self, asset_class: AssetClass):
-        """ Calculate totals for asset class by adding all the children values """
-        # Is this the final asset class, the one with stocks?
-        if asset_class.stocks:
-            # add all the stocks
-            stocks_sum = Decimal(0)
+        # Children come before their parents, so each class is complete when it is reached.
+        for index, asset_class in enumerate(order):
+            value = Decimal(0)
             for stock in asset_class.stocks:
                 # recalculate into base currency!
-                stocks_sum += stock.value_in_base_currency
+                value += stock.value_in_base_currency
+            value += children_values[index]
+            asset_class.curr_value = value
+
+            parent = parents[index]
+            if parent < 0:
+                total += value
+            else:
+                children_values[parent] += value
+        self.total_amount = total
 
-            asset_class.curr_value = stocks_sum
+    def invalidate_tree(self):
+        """ Call after changing the tree structure, so that it gets flattened again """
+        self.__tree_version += 1
 
-        if asset_class.classes:
-            # load totals for child classes
-            for child in asset_class.classes:
-                self.__calculate_current_value(child)
-                asset_class.curr_value += child.curr_value
+    def __get_flat_tree(self) -> tuple:
+        """
+        The tree flattened once into a list, with all the children before their parent,
+        and the position of each class's parent in that list. -1 for the first level.
+        """
+        if self.__post_order_version == self.__tree_version:
+            return self.__post_order, self.__parent_index
+
+        order = []
+        tree_parents = []
+        stack = [(ac, None, False) for ac in reversed(self.classes)]
+        while stack:
+            ac, parent, children_done = stack.pop()
+            if children_done:
+                order.append(ac)
+                tree_parents.append(parent)
+                continue
+            stack.append((ac, parent, True))
+            for child in reversed(ac.classes):
+                stack.append((child, ac, False))
+
+        position = {id(ac): index for index, ac in enumerate(order)}
+        self.__post_order = order
+        self.__parent_index = [position[id(parent)] if parent is not None else -1
+                               for parent in tree_parents]
+        self.__post_order_version = self.__tree_version
+        return order, self.__parent_index
@@ -0,0 +1,266 @@
+"""
+Lightweight instrumentation of the processing stages.
+The code marks the stages with profiling.stage(name). Nothing is recorded unless a
+profiler is enabled, i.e. by the --profile option in the cli.
+For each stage the wall time, the number of SQL statements per database and the
+number of rows processed are recorded.
+The stages can be saved in the Chrome trace-event format, to open in a trace viewer
+such as chrome://tracing or Perfetto.
+"""
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+from typing import Dict, List
+
+# The active profiler, if any.
+_profiler = None
+# Used for the stages when profiling is disabled.
+_no_stage = nullcontext()
+
+
+class Span:
+    """ One recorded stage """
+    __slots__ = ("name", "start", "duration", "thread_id", "statements", "rows", "depth",
+                 "attributes")
+
+    def __init__(self, name: str, start: float, depth: int, attributes: dict = None):
+        self.name = name
+        # Seconds since the profiler was enabled.
+        self.start = start
+        self.duration: float = None
+        self.thread_id = threading.get_ident()
+        # SQL statement count, by database file name.
+        self.statements: Dict[str, int] = {}
+        self.rows: int = None
+        # Nesting level of the stage.
+        self.depth = depth
+        # Additional information, i.e. the symbol.
+        self.attributes = attributes
+
+    @property
+    def statement_count(self) -> int:
+        """ Statements on all the databases """
+        return sum(self.statements.values())
+
+    def to_dict(self) -> dict:
+        """ For the JSON output """
+        return {
+            "name": self.name,
+            "start": self.start,
+            "duration": self.duration,
+            "thread_id": self.thread_id,
+            "depth": self.depth,
+            "statements": dict(self.statements),
+            "rows": self.rows,
+            "attributes": self.attributes,
+        }
+
+    def to_trace_event(self, process_id: int) -> dict:
+        """ Complete event in the Chrome trace-event format. The times are in microseconds. """
+        args = dict(self.attributes or {})
+        if self.statements:
+            args["statements"] = dict(self.statements)
+        if self.rows is not None:
+            args["rows"] = self.rows
+        return {
+            "name": self.name,
+            "cat": "asset_allocation",
+            "ph": "X",
+            "ts": self.start * 1000000,
+            "dur": (self.duration or 0) * 1000000,
+            "pid": process_id,
+            "tid": self.thread_id,
+            "args": args,
+        }
+
+
+class _SpanContext:
+    """ Context manager that records one span """
+    __slots__ = ("profiler", "name", "attributes", "span")
+
+    def __init__(self, profiler, name: str, attributes: dict):
+        self.profiler = profiler
+        self.name = name
+        self.attributes = attributes
+        self.span: Span = None
+
+    def __enter__(self):
+        self.span = self.profiler.start_span(self.name, self.attributes)
+        return self.span
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.end_span(self.span)
+
+
+class Profiler:
+    """
+    Records the stages. The SQL statements are counted through SQLAlchemy engine
+    events and attributed to the innermost open stage of the executing thread or,
+    if it has none, to the innermost open stage in any thread.
+    """
+    def __init__(self):
+        self.spans: List[Span] = []
+        self.started = time.perf_counter()
+        # The stages that are currently open, the innermost last.
+        self.open_spans: List[Span] = []
+        self.lock = threading.Lock()
+
+    def start_span(self, name: str, attributes: dict = None) -> Span:
+        """ Opens a stage """
+        with self.lock:
+            span = Span(name, time.perf_counter() - self.started, len(self.open_spans),
+                        attributes)
+            self.spans.append(span)
+            self.open_spans.append(span)
+        return span
+
+    def end_span(self, span: Span):
+        """ Closes the stage """
+        with self.lock:
+            span.duration = time.perf_counter() - self.started - span.start
+            self.open_spans.remove(span)
+
+    def count_statement(self, database: str):
+        """ Adds an SQL statement to the innermost open stage """
+        with self.lock:
+            span = self.__get_current_span()
+            if not span:
+                return
+            span.statements[database] = span.statements.get(database, 0) + 1
+
+    def add_rows(self, count: int):
+        """ Adds the processed rows to the innermost open stage """
+        with self.lock:
+            span = self.__get_current_span()
+            if not span:
+                return
+            span.rows = (span.rows or 0) + count
+
+    def __get_current_span(self) -> Span:
+        """ The innermost open span of the current thread, or of any thread """
+        if not self.open_spans:
+            return None
+        thread_id = threading.get_ident()
+        for span in reversed(self.open_spans):
+            if span.thread_id == thread_id:
+                return span
+        return self.open_spans[-1]
+
+    def to_dict(self) -> dict:
+        """ All the stages, for the JSON output """
+        return {"spans": [span.to_dict() for span in self.spans]}
+
+    def to_json(self) -> str:
+        """ The stages as JSON """
+        return json.dumps(self.to_dict(), indent=2)
+
+    def to_chrome_trace(self) -> dict:
+        """ The stages as Chrome trace events """
+        process_id = os.getpid()
+        return {
+            "traceEvents": [span.to_trace_event(process_id) for span in self.spans],
+            "displayTimeUnit": "ms",
+        }
+
+    def save_trace(self, file_path: str):
+        """ Writes the stages to a file in the Chrome trace-event format """
+        with open(file_path, mode="w") as trace_file:
+            json.dump(self.to_chrome_trace(), trace_file)
+
+    def format(self) -> str:
+        """
+        Text table with the stages. The spans with attributes, i.e. per symbol,
+        are summarized by name, with the slowest one.
+        """
+        output = f"{'stage':<36} {'ms':>9} {'sql':>6} {'rows':>8}  databases\n"
+        # name -> spans with attributes
+        details: Dict[str, List[Span]] = {}
+        for span in self.spans:
+            if span.attributes:
+                details.setdefault(span.name, []).append(span)
+                continue
+            name = "  " * span.depth + span.name
+            rows = "" if span.rows is None else str(span.rows)
+            databases = ", ".join(f"{database}: {count}"
+                                  for database, count in sorted(span.statements.items()))
+            output += (f"{name:<36} {(span.duration or 0) * 1000:>9.1f} "
+                       f"{span.statement_count:>6} {rows:>8}  {databases}\n")
+
+        for name, spans in details.items():
+            total = sum(span.duration or 0 for span in spans)
+            slowest = max(spans, key=lambda span: span.duration or 0)
+            attributes = ", ".join(f"{key}={value}" for key, value in slowest.attributes.items())
+            output += (f"{name}: {len(spans)} spans, {total * 1000:.1f} ms, slowest "
+                       f"{(slowest.duration or 0) * 1000:.1f} ms ({attributes})\n")
+        return output
+
+
+def enable() -> Profiler:
+    """ Starts recording. Returns the profiler with the results. """
+    global _profiler
+
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    _profiler = Profiler()
+    # Listen on the Engine class, to count the statements of all the databases.
+    if not event.contains(Engine, "before_cursor_execute", _on_execute):
+        event.listen(Engine, "before_cursor_execute", _on_execute)
+    return _profiler
+
+
+def disable():
+    """ Stops recording """
+    global _profiler
+
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    _profiler = None
+    if event.contains(Engine, "before_cursor_execute", _on_execute):
+        event.remove(Engine, "before_cursor_execute", _on_execute)
+
+
+def get_profiler() -> Profiler:
+    """ The active profiler, or None """
+    return _profiler
+
+
+def stage(name: str, **attributes):
+    """
+    Records the enclosed code as a stage, if profiling is enabled.
+    Use as a context manager. The attributes, i.e. symbol, are stored with the stage.
+    """
+    profiler = _profiler
+    if not profiler:
+        return _no_stage
+    return _SpanContext(profiler, name, attributes or None)
+
+
+def profiled(name: str):
+    """ Decorator. Records the calls of the function as a stage. """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def add_rows(count: int):
+    """ Records the number of rows processed in the current stage """
+    profiler = _profiler
+    if profiler:
+        profiler.add_rows(count)
+
+
+def _on_execute(conn, cursor, statement, parameters, context, executemany):
+    """ SQLAlchemy event handler """
+    profiler = _profiler
+    if profiler:
+        database = os.path.basename(conn.engine.url.database or "memory")
+        profiler.count_statement(database)
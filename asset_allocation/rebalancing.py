@@ -0,0 +1,403 @@
+"""
+Rebalancing of the calculated model.
+Turns the differences between the set and the current values of the leaf asset classes
+into buy and sell trades of the securities in those classes.
+Each leaf is handled on its own, with as few trades as possible, so the work is
+proportional to the number of holdings.
+Contributions and withdrawals are distributed over the leaf classes without trading
+the other holdings.
+"""
+import heapq
+from decimal import ROUND_FLOOR, Decimal
+from typing import Dict, List
+
+from .model import AssetAllocationModel, AssetClass, Stock
+
+
+class Trade:
+    """ Buy or sell order for a security. Negative quantity is a sale. """
+    __slots__ = ("symbol", "asset_class", "quantity", "price", "currency", "value_in_base_currency")
+
+    def __init__(self, stock: Stock, quantity: Decimal, rate: Decimal):
+        self.symbol = stock.symbol
+        self.asset_class = stock.asset_class
+        self.quantity = quantity
+        self.price = stock.price
+        self.currency = stock.currency
+        self.value_in_base_currency = self.value * rate
+
+    @property
+    def action(self) -> str:
+        """ buy or sell """
+        return "buy" if self.quantity > 0 else "sell"
+
+    @property
+    def value(self) -> Decimal:
+        """ Value of the trade in the security's currency """
+        return self.quantity * self.price
+
+    def __repr__(self):
+        return f"<Trade ({self.action} {abs(self.quantity)} {self.symbol})>"
+
+
+class RebalancingPlan:
+    """ The trades to bring the leaf classes within their thresholds """
+    def __init__(self, currency: str = None):
+        # Base currency.
+        self.currency = currency
+        self.trades: List[Trade] = []
+        # Classes that stay out of tolerance. (full name, reason)
+        self.unresolved: List[tuple] = []
+
+    @property
+    def cash_flow(self) -> Decimal:
+        """ Cash released by the trades, in base currency. Negative when cash is needed. """
+        return -sum((trade.value_in_base_currency for trade in self.trades), Decimal(0))
+
+    def format(self) -> str:
+        """ Text table with the trades """
+        if not self.trades and not self.unresolved:
+            return "All the asset classes are within their thresholds."
+
+        output = ""
+        for trade in self.trades:
+            output += (f"{trade.action:<5} {abs(trade.quantity):>10,.2f} {trade.symbol:<16} "
+                       f"@ {trade.price:>10,.2f} {trade.currency or '':<4} "
+                       f"{trade.value_in_base_currency:>12,.2f}  {trade.asset_class}\n")
+        output += (f"\n{len(self.trades)} trades. "
+                   f"Cash flow: {self.cash_flow:,.2f} {self.currency or ''}\n")
+        for name, reason in self.unresolved:
+            output += f"{name} stays out of tolerance: {reason}\n"
+        return output
+
+
+class Rebalancer:
+    """
+    Generates the trades for the leaf asset classes that are out of tolerance.
+    The tolerance is a percentage of the set value. The class's own threshold applies to
+    the whole branch below it.
+    Buys go to the most expensive security first, in whole shares, and the rest to the
+    cheaper ones while the class is still out of tolerance.
+    Sales start from the largest holding, to touch as few holdings as possible, and never
+    sell more than the difference.
+    No trade is smaller than min_trade. The classes that can not be brought within
+    tolerance are listed in the plan.
+    """
+    def __init__(self, model: AssetAllocationModel):
+        self.model = model
+        # Tolerance, in %, for the classes without a threshold in the branch.
+        self.threshold = Decimal(0)
+        # Thresholds by class full name. Take precedence over the classes' own thresholds.
+        self.thresholds: Dict[str, Decimal] = {}
+        # The smallest trade, in base currency.
+        self.min_trade = Decimal(0)
+        # Exchange rates into base currency. The model's rates are used if not given.
+        self.rates: Dict[str, Decimal] = {}
+        # Resolved thresholds, by class.
+        self.__class_thresholds: Dict[int, Decimal] = {}
+
+    def rebalance(self) -> RebalancingPlan:
+        """ Creates the trades for all the leaf classes """
+        for name in self.thresholds:
+            if not self.model.get_class_by_fullname(name):
+                raise ValueError(f"Asset class {name} not found")
+
+        rates = self.__get_rates()
+        unpriced = set(self.model.unpriced_symbols)
+        cash = self.model.get_cash_asset_class()
+        self.__class_thresholds = {}
+
+        plan = RebalancingPlan(self.model.currency)
+        for ac in self.model.asset_classes:
+            if ac.classes or ac is cash:
+                # Cash is what the trades are paid with.
+                continue
+
+            # Positive to buy, negative to sell.
+            difference = ac.alloc_value - ac.curr_value
+            tolerance = ac.alloc_value * self.__get_threshold(ac) / 100
+            if abs(difference) <= tolerance:
+                continue
+            if abs(difference) < self.min_trade:
+                plan.unresolved.append((ac.fullname, "the trade would be below the minimum"))
+                continue
+
+            stocks = [stock for stock in ac.stocks
+                      if isinstance(stock, Stock) and stock.price and stock.currency in rates
+                      and stock.symbol not in unpriced]
+            if not stocks:
+                plan.unresolved.append((ac.fullname, "no security to trade"))
+                continue
+
+            if difference > 0:
+                trades = self.__buy(stocks, difference, tolerance, rates)
+            else:
+                trades = self.__sell(stocks, -difference, tolerance, rates)
+            plan.trades.extend(trades)
+
+            remaining = difference - sum((trade.value_in_base_currency for trade in trades),
+                                         Decimal(0))
+            if abs(remaining) > tolerance:
+                plan.unresolved.append(
+                    (ac.fullname, f"{remaining:,.2f} left after whole-share trades"))
+        return plan
+
+    def __buy(self, stocks: List[Stock], amount: Decimal, tolerance: Decimal,
+              rates: Dict[str, Decimal]) -> List[Trade]:
+        """
+        Purchases until the class is within tolerance, in one pass over the securities
+        from the most expensive. Each one takes the whole shares that fit in the remaining
+        amount, or one more if that ends within tolerance. The cheaper ones take the rest.
+        """
+        trades = []
+        remaining = amount
+        for stock, price_in_base in self.__by_price(stocks, rates):
+            if remaining <= tolerance:
+                break
+            quantity = (remaining / price_in_base).to_integral_value(ROUND_FLOOR)
+            if remaining - quantity * price_in_base > tolerance and \
+                    (quantity + 1) * price_in_base - remaining <= tolerance:
+                quantity += 1
+            if not quantity or quantity * price_in_base < self.min_trade:
+                # Too expensive for the remaining amount, or below the minimum trade.
+                continue
+            trade = Trade(stock, quantity, rates[stock.currency])
+            trades.append(trade)
+            remaining -= trade.value_in_base_currency
+        return trades
+
+    def __sell(self, stocks: List[Stock], amount: Decimal, tolerance: Decimal,
+               rates: Dict[str, Decimal]) -> List[Trade]:
+        """
+        Sales from the largest holdings until the class is within tolerance.
+        Only whole shares are sold, never more than the remaining amount, so a fractional
+        holding keeps its fraction.
+        """
+        trades = []
+        remaining = amount
+        for stock in sorted(stocks, key=lambda stock: stock.value_in_base_currency or 0,
+                            reverse=True):
+            if remaining <= tolerance:
+                break
+            if not stock.quantity or stock.quantity <= 0:
+                continue
+            price_in_base = stock.price * rates[stock.currency]
+            quantity = min((remaining / price_in_base).to_integral_value(ROUND_FLOOR),
+                           stock.quantity.to_integral_value(ROUND_FLOOR))
+            if not quantity or quantity * price_in_base < self.min_trade:
+                # Too expensive for the remaining amount, or below the minimum trade.
+                continue
+            trade = Trade(stock, -quantity, rates[stock.currency])
+            trades.append(trade)
+            remaining += trade.value_in_base_currency
+        return trades
+
+    def __by_price(self, stocks: List[Stock], rates: Dict[str, Decimal]) -> List[tuple]:
+        """ (stock, price in base currency), the most expensive first """
+        prices = [(stock, stock.price * rates[stock.currency]) for stock in stocks]
+        prices.sort(key=lambda item: item[1], reverse=True)
+        return prices
+
+    def __get_threshold(self, ac: AssetClass) -> Decimal:
+        """ The nearest threshold in the branch, from the class up """
+        path = []
+        node = ac
+        threshold = self.threshold
+        while node is not None:
+            if id(node) in self.__class_thresholds:
+                threshold = self.__class_thresholds[id(node)]
+                break
+            path.append(node)
+            if node.fullname in self.thresholds:
+                threshold = self.thresholds[node.fullname]
+                break
+            if node.threshold:
+                threshold = node.threshold
+                break
+            node = node.parent
+
+        # Remember for the siblings and the other classes in the branch.
+        for visited in path:
+            self.__class_thresholds[id(visited)] = threshold
+        return threshold
+
+    def __get_rates(self) -> Dict[str, Decimal]:
+        """
+        Exchange rates loaded with the model, or implied by the holdings' values,
+        plus the given ones
+        """
+        rates = {self.model.currency: Decimal(1)}
+        rates.update(self.model.exchange_rates)
+        for stock in self.model.stocks:
+            if not isinstance(stock, Stock) or stock.currency in rates:
+                continue
+            if stock.value and stock.value_in_base_currency is not None:
+                rates[stock.currency] = stock.value_in_base_currency / stock.value
+        rates.update(self.rates)
+        return rates
+
+
+class ClassAmount:
+    """ The part of a contribution, or withdrawal, for one leaf class """
+    __slots__ = ("asset_class", "amount", "securities")
+
+    def __init__(self, asset_class: str, amount: Decimal):
+        self.asset_class = asset_class
+        # In base currency. Negative for withdrawals.
+        self.amount = amount
+        # Amounts by symbol.
+        self.securities: Dict[str, Decimal] = {}
+
+    def __repr__(self):
+        return f"<ClassAmount ({self.asset_class} {self.amount:.2f})>"
+
+
+class ContributionPlan:
+    """ The distribution of a contribution, or a withdrawal, over the leaf classes """
+    def __init__(self, amount: Decimal, currency: str = None):
+        # Negative for withdrawals.
+        self.amount = amount
+        self.currency = currency
+        self.classes: List[ClassAmount] = []
+        # The part of the amount that is not placed in any security, i.e. for the classes
+        # without a tradable security, or a withdrawal that exceeds the holdings.
+        # Same sign as the amount.
+        self.unallocated = Decimal(0)
+
+    def format(self) -> str:
+        """ Text table with the amounts per class and security """
+        output = ""
+        for item in self.classes:
+            output += f"{item.asset_class:<40} {item.amount:>14,.2f}\n"
+            if not item.securities:
+                output += "  (no security to trade)\n"
+            for symbol, amount in item.securities.items():
+                output += f"  {symbol:<38} {amount:>14,.2f}\n"
+        output += f"\nTotal: {self.amount - self.unallocated:,.2f} {self.currency or ''}\n"
+        if self.unallocated:
+            output += f"Not allocated: {abs(self.unallocated):,.2f}\n"
+        return output
+
+
+class ContributionAllocator:
+    """
+    Distributes new money to the most underweight leaf classes, or takes a withdrawal
+    from the most overweight ones, without selling anything else.
+    The classes are ordered by their current value relative to the set value, in a heap.
+    The lowest are filled up to the level of the next one, until the amount is used,
+    so that all the filled classes end at the same relative level.
+    Withdrawals first take from the holdings in classes with no set allocation.
+    Cash is where the money comes from, or goes to, and is not part of the distribution.
+    """
+    def __init__(self, model: AssetAllocationModel):
+        self.model = model
+        self.__unpriced = set()
+
+    def allocate(self, amount: Decimal) -> ContributionPlan:
+        """ Positive amount is a contribution, negative a withdrawal. In base currency. """
+        plan = ContributionPlan(amount, self.model.currency)
+        self.__unpriced = set(self.model.unpriced_symbols)
+        cash = self.model.get_cash_asset_class()
+        leaves = [ac for ac in self.model.asset_classes if not ac.classes and ac is not cash]
+
+        if amount > 0:
+            amounts = self.__fill(leaves, amount)
+        else:
+            amounts = self.__drain(leaves, -amount)
+
+        placed = Decimal(0)
+        for ac, class_amount in amounts:
+            if not class_amount:
+                continue
+            item = ClassAmount(ac.fullname, class_amount)
+            item.securities = self.__split(ac, class_amount)
+            if item.securities:
+                placed += class_amount
+            plan.classes.append(item)
+        # Anything not placed in a security, including a withdrawal above the holdings.
+        # In cents, to drop the division remainders of the class amounts.
+        plan.unallocated = (amount - placed).quantize(Decimal("0.01"))
+        plan.classes.sort(key=lambda item: abs(item.amount), reverse=True)
+        return plan
+
+    def __fill(self, leaves: List[AssetClass], amount: Decimal) -> List[tuple]:
+        """ Raises the lowest classes, relative to the set value, by the amount """
+        heap = [(ac.curr_value / ac.alloc_value, index, ac)
+                for index, ac in enumerate(leaves) if ac.alloc_value > 0]
+        if not heap:
+            return []
+        heapq.heapify(heap)
+        level, filled = self.__get_level(heap, amount, 1)
+        return [(ac, (level - ratio) * ac.alloc_value) for ratio, ac in filled]
+
+    def __drain(self, leaves: List[AssetClass], amount: Decimal) -> List[tuple]:
+        """ Lowers the highest classes, relative to the set value, by up to the amount """
+        result = []
+        remaining = amount
+        # Holdings without a set allocation go first.
+        for ac in sorted((ac for ac in leaves if ac.alloc_value <= 0 and ac.curr_value > 0),
+                         key=lambda ac: ac.curr_value, reverse=True):
+            if remaining <= 0:
+                break
+            taken = min(ac.curr_value, remaining)
+            result.append((ac, -taken))
+            remaining -= taken
+
+        heap = [(-(ac.curr_value / ac.alloc_value), index, ac)
+                for index, ac in enumerate(leaves) if ac.alloc_value > 0 and ac.curr_value > 0]
+        if remaining <= 0 or not heap:
+            return result
+        heapq.heapify(heap)
+        level, drained = self.__get_level(heap, remaining, -1)
+        if level <= 0:
+            # As much as the holdings, or more. Everything is taken.
+            result.extend((ac, -ac.curr_value) for _, ac in drained)
+        else:
+            result.extend((ac, (level - ratio) * ac.alloc_value) for ratio, ac in drained)
+        return result
+
+    def __get_level(self, heap: List[tuple], amount: Decimal, direction: int) -> tuple:
+        """
+        Moves the classes from the top of the heap, in the direction, to a common level
+        until the amount is used. The heap keys are the relative values, negated for
+        the withdrawals. Returns the final level and the moved (ratio, class) pairs.
+        """
+        moved = []
+        weight = Decimal(0)
+        level = None
+        remaining = amount
+        while heap:
+            key, _, ac = heap[0]
+            ratio = key * direction
+            if moved:
+                cost = (ratio - level) * direction * weight
+                if cost >= remaining:
+                    break
+                remaining -= cost
+            heapq.heappop(heap)
+            level = ratio
+            moved.append((ratio, ac))
+            weight += ac.alloc_value
+        level += direction * remaining / weight
+        return level, moved
+
+    def __split(self, ac: AssetClass, amount: Decimal) -> Dict[str, Decimal]:
+        """ The class amount by security, in proportion to the current values """
+        stocks = [stock for stock in ac.stocks
+                  if isinstance(stock, Stock) and stock.symbol not in self.__unpriced]
+        if not stocks:
+            return {}
+        values = [stock.value_in_base_currency or Decimal(0) for stock in stocks]
+        total = sum(values, Decimal(0))
+        if not total:
+            if amount < 0:
+                return {}
+            # Nothing held yet. Split evenly.
+            values = [Decimal(1)] * len(stocks)
+            total = Decimal(len(stocks))
+
+        result = {}
+        for stock, value in zip(stocks, values):
+            if value:
+                result[stock.symbol] = result.get(stock.symbol, Decimal(0)) + amount * value / total
+        return result
@@ -5,8 +5,6 @@ import sys
 import click
 import click_log
 
-from .app import AppAggregate
-
 logger = logging.getLogger(__name__)
 click_log.basic_config(logger)
 
@@ -22,6 +20,8 @@ def sl():
 @click_log.simple_verbosity_option(logger)
 def add(assetclass: int, symbol: str):
     """ Add a stock to an asset class """
+    from .app import AppAggregate
+
     assert isinstance(symbol, str)
     assert isinstance(assetclass, int)
 
@@ -32,40 +32,36 @@ def add(assetclass: int, symbol: str):
 
 @click.command("import")
 @click.argument("file")
-def import_csv(file):
+@click.option("--upsert", is_flag=True, default=False,
+              help="Keep the existing links, matched on asset class and symbol, "
+                   "instead of adding them again")
+@click.option("--dry-run", is_flag=True, default=False,
+              help="Validate the file and roll the changes back")
+@click.option("--batch-size", type=int, default=1000, help="Rows written per statement")
+def import_csv(file, upsert: bool, dry_run: bool, batch_size: int):
     """ Import stock links from a .csv file """
-    lines = ""
-    with open(file) as csv_file:
-        lines = csv_file.readlines()
+    from .app import AppAggregate
+    from .dal import AssetClassStock
+    from .importer import CsvImporter
 
-    # Header, the first line.    
-    header = lines[0]
-    lines.remove(header)
-    header = header.rstrip()
+    session = AppAggregate().open_session()
+    importer = CsvImporter(session, AssetClassStock, key=("assetclassid", "symbol"),
+                           batch_size=batch_size)
+    importer.upsert = upsert
+    importer.dry_run = dry_run
+    report = importer.import_file(file)
+    session.close()
+
+    print(report.format())
+    if not report.is_valid:
+        sys.exit(1)
 
-    # Parse records from a csv row.
-    counter = 0
-    app = AppAggregate()
-    app.open_session()
-    for line in lines:
-        # Create insert statements
-        line = line.rstrip()
-        command = f"insert into AssetClass_Stock ({header}) values ({line});"
-        # insert records
-        app.session.execute(command)
-        try:
-            app.save()
-        except:
-            print(f"error: ", sys.exc_info()[0])
-            app.session.close()
-        counter += 1
-    print(f"Data imported. {counter} rows created.")
-
-    return False
 
 @click.command("export")
 def export_symbols():
     """ Exports all the symbols used in asset allocation """
+    from .app import AppAggregate
+
     app = AppAggregate()
     app.export_symbols()
 
@@ -73,6 +69,8 @@ def export_symbols():
 @click_log.simple_verbosity_option(logger)
 def unallocated():
     """ Identify unallocated holdings """
+    from .app import AppAggregate
+
     app = AppAggregate()
     app.logger = logger
     unalloc = app.find_unallocated_holdings()
@@ -81,7 +79,10 @@ def unallocated():
         print(f"No unallocated holdings.")
 
     for item in unalloc:
-        print(item)
+        value = ""
+        if item.value_in_base_currency is not None:
+            value = f"{item.value_in_base_currency:,.2f}"
+        print(f"{item.symbol:<20} {item.quantity:>12,.2f} {value:>14}")
 
 
 #############################
@@ -1,9 +1,9 @@
 """ Operations on Stocks in GC book """
 import os
+from datetime import date
 from decimal import Decimal
-from typing import List
+from typing import Dict, List, Tuple
 
-from pkg_resources import Requirement, resource_filename
 
 import piecash
 from piecash import Book, open_book
@@ -11,7 +11,7 @@ from gnucash_portfolio.securitiesaggregate import SecuritiesAggregate
 
 from pricedb import PriceModel, SecuritySymbol
 
-from .config import Config, ConfigKeys
+from .config import Config, ConfigKeys, get_config, get_resource_path
 
 
 class StocksInfo:
@@ -21,7 +21,7 @@ class StocksInfo:
     """
 
     def __init__(self, config: Config = None):
-        self.config = config if config else Config()
+        self.config = config if config else get_config()
         # GnuCash db session/book.
         self.gc_book: Book = None
         # Prices session.
@@ -44,6 +44,58 @@ class StocksInfo:
         quantity = sec.get_quantity()
         return quantity
 
+    def load_stock_quantities(self, symbols: List[str]) -> Dict[str, Decimal]:
+        """
+        Retrieves the quantities for all the given symbols at once.
+        The splits are summed per security in one grouped query over the book.
+        """
+        from piecash import Account, Commodity
+
+        book = self.get_gc_book()
+
+        # Resolve the symbols to securities. Accept symbols with or without namespace.
+        securities = (
+            book.session.query(Commodity.guid, Commodity.namespace, Commodity.mnemonic)
+            .filter(Commodity.namespace != "CURRENCY",
+                    Commodity.namespace != "template")
+            .all()
+        )
+        guids = {}
+        for guid, namespace, mnemonic in securities:
+            guids[f"{namespace}:{mnemonic}"] = guid
+            guids.setdefault(mnemonic, guid)
+
+        for symbol in symbols:
+            if symbol not in guids:
+                raise ValueError(f"Security not found in GC book: {symbol}!")
+
+        totals = self.__sum_split_quantities(book, Account.commodity_guid)
+
+        result = {}
+        for symbol in symbols:
+            result[symbol] = totals.get(guids[symbol], Decimal(0))
+        return result
+
+    def load_security_balances(self) -> Dict[str, Decimal]:
+        """
+        Quantities of all the securities with a positive balance, by full symbol.
+        The splits are summed in one grouped query over the book.
+        """
+        from piecash import Commodity
+
+        book = self.get_gc_book()
+
+        symbol = (Commodity.namespace + ":" + Commodity.mnemonic).label("symbol")
+        totals = self.__sum_split_quantities(book, symbol)
+
+        result = {}
+        for symbol, quantity in totals.items():
+            if quantity > Decimal(0):
+                result[symbol] = quantity
+            elif self.logger:
+                self.logger.debug(f"0 balance for {symbol}")
+        return result
+
     def load_latest_price(self, symbol: SecuritySymbol) -> PriceModel:
         """ Loads the latest price for security """
         assert isinstance(symbol, SecuritySymbol)
@@ -52,6 +104,51 @@ class StocksInfo:
         result = self.__load_latest_prices_from_pricedb(symbol)
         return result
 
+    def load_latest_prices(self, symbols: List[SecuritySymbol]
+                           ) -> Dict[Tuple[str, str], PriceModel]:
+        """
+        Loads the latest prices for all the given securities in one query.
+        Returns the prices keyed by (namespace, mnemonic). Symbols without a price are omitted.
+        """
+        from pricedb import dal, mappers
+        from sqlalchemy import func
+
+        session = self.__get_pricedb_session()
+
+        # Number the prices for each security, the latest first.
+        row_number = func.row_number().over(
+            partition_by=(dal.Price.namespace, dal.Price.symbol),
+            order_by=(dal.Price.date.desc(), dal.Price.time.desc())
+        ).label("row_number")
+        numbered = session.query(dal.Price.id, row_number).subquery()
+        query = (
+            session.query(dal.Price)
+            .join(numbered, dal.Price.id == numbered.c.id)
+            .filter(numbered.c.row_number == 1)
+        )
+
+        mapper = mappers.PriceMapper()
+        latest = {}
+        # Symbols without a namespace match the latest price in any namespace.
+        latest_by_mnemonic = {}
+        for entity in query.all():
+            latest[(entity.namespace, entity.symbol)] = entity
+            current = latest_by_mnemonic.get(entity.symbol)
+            if not current or (entity.date, entity.time or "") > (current.date, current.time or ""):
+                latest_by_mnemonic[entity.symbol] = entity
+
+        result = {}
+        for symbol in symbols:
+            assert isinstance(symbol, SecuritySymbol)
+
+            if symbol.namespace:
+                entity = latest.get((symbol.namespace, symbol.mnemonic))
+            else:
+                entity = latest_by_mnemonic.get(symbol.mnemonic)
+            if entity:
+                result[(symbol.namespace, symbol.mnemonic)] = mapper.map_entity(entity)
+        return result
+
     def get_gc_book(self):
         """ Returns the GnuCash db session """
         if not self.gc_book:
@@ -60,8 +157,7 @@ class StocksInfo:
                 raise AttributeError("GnuCash book path not configured.")
             # check if this is the abs file exists
             if not os.path.isabs(gc_db):
-                gc_db = resource_filename(
-                    Requirement.parse("Asset-Allocation"), gc_db)
+                gc_db = get_resource_path(gc_db)
                 if not os.path.exists(gc_db):
                     raise ValueError(f"Invalid GnuCash book path {gc_db}")
 
@@ -70,24 +166,37 @@ class StocksInfo:
 
     def get_symbols_with_positive_balances(self) -> List[str]:
         """ Identifies all the securities with positive balances """
-        from gnucash_portfolio import BookAggregate
-
-        holdings = []
-
-        with BookAggregate() as book:
-            # query = book.securities.query.filter(Commodity.)
-            holding_entities = book.securities.get_all()
-            for item in holding_entities:
-                # Check holding balance
-                agg = book.securities.get_aggregate(item)
-                balance = agg.get_num_shares()
-                if balance > Decimal(0):
-                    holdings.append(f"{item.namespace}:{item.mnemonic}")
-                else:
-                    self.logger.debug(f"0 balance for {item}")
-            # holdings = map(lambda x: , holding_entities)
-
-        return holdings
+        return list(self.load_security_balances())
+
+    def __sum_split_quantities(self, book: Book, key_column) -> Dict[object, Decimal]:
+        """
+        Sums the split quantities of the securities, grouped by the given column.
+        Numerators are summed per denominator to keep the result exact.
+        """
+        from piecash import Account, Commodity, Split, Transaction
+        from piecash.core.account import AccountType, positive_types
+        from sqlalchemy import func
+
+        query = (
+            book.session.query(
+                key_column, Account.type, Split._quantity_denom,
+                func.sum(Split._quantity_num))
+            .select_from(Commodity)
+            .join(Account, Account.commodity_guid == Commodity.guid)
+            .join(Split, Split.account_guid == Account.guid)
+            .join(Transaction, Split.transaction_guid == Transaction.guid)
+            .filter(Commodity.namespace != "CURRENCY",
+                    Commodity.namespace != "template")
+            .filter(Account.type != AccountType.trading.value)
+            .filter(Transaction.post_date <= date.today())
+            .group_by(key_column, Account.type, Split._quantity_denom)
+        )
+        totals = {}
+        for key, account_type, denom, num in query.all():
+            sign = 1 if account_type in positive_types else -1
+            quantity = Decimal(num) / Decimal(denom) * sign
+            totals[key] = totals.get(key, Decimal(0)) + quantity
+        return totals
 
     def __load_latest_prices_from_gnucash(self, symbol):
         """ Load security prices from GnuCash book. Deprecated. """
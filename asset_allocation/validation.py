@@ -0,0 +1,173 @@
+"""
+Validation of the Asset Allocation model.
+Collects all the issues found in the model into a report, instead of stopping at the first one.
+"""
+from decimal import Decimal
+from enum import Enum, auto
+from typing import Dict, List
+
+from .model import AssetAllocationModel, AssetClass, Stock
+
+
+class IssueType(Enum):
+    """ The kinds of problems that validation reports """
+    # Branch allocation does not match the sum of its children.
+    allocation_mismatch = auto()
+    # The first-level allocations do not add up to 100.
+    total_allocation = auto()
+    parent_cycle = auto()
+    # The parent of the class does not exist.
+    orphaned_class = auto()
+    # The class contains both child classes and stocks.
+    mixed_class = auto()
+    # The symbol is linked more than once.
+    duplicate_symbol = auto()
+    # The stock link points to a class that does not exist.
+    missing_class = auto()
+    missing_price = auto()
+
+
+class ValidationIssue:
+    """ One problem found in the model """
+    def __init__(self, issue_type: IssueType, message: str):
+        self.issue_type = issue_type
+        self.message = message
+
+    def __repr__(self):
+        return f"<ValidationIssue ({self.issue_type.name}: {self.message})>"
+
+
+class ValidationReport:
+    """ All the issues found in the model """
+    def __init__(self):
+        self.issues: List[ValidationIssue] = []
+
+    @property
+    def is_valid(self) -> bool:
+        """ The model is valid if there are no issues """
+        return not self.issues
+
+    def add(self, issue_type: IssueType, message: str):
+        """ Records an issue """
+        self.issues.append(ValidationIssue(issue_type, message))
+
+    def get_issues(self, issue_type: IssueType) -> List[ValidationIssue]:
+        """ Issues of the given type """
+        return [issue for issue in self.issues if issue.issue_type == issue_type]
+
+    def format(self) -> str:
+        """ Text report, grouped by the issue type """
+        if self.is_valid:
+            return "The model is valid. Congratulations"
+
+        output = f"The model is invalid. {len(self.issues)} issue(s) found.\n"
+        for issue_type in IssueType:
+            issues = self.get_issues(issue_type)
+            if not issues:
+                continue
+            output += f"\n{issue_type.name} ({len(issues)}):\n"
+            for issue in issues:
+                output += f"  {issue.message}\n"
+        return output
+
+
+class ModelValidator:
+    """
+    Validates the model in a single pass through the tree.
+    The sums of the leaf allocations are calculated once per branch, bottom-up.
+    """
+    def __init__(self, model: AssetAllocationModel):
+        self.model = model
+        self.report: ValidationReport = None
+
+    def validate(self) -> ValidationReport:
+        """ Runs all the checks and returns the report """
+        self.report = ValidationReport()
+
+        self.__validate_tree()
+        self.__validate_total()
+        self.__validate_detached_classes()
+        self.__validate_stocks()
+
+        return self.report
+
+    def __validate_tree(self):
+        """ Post-order traversal. Checks allocations against the children and the class contents """
+        # Sum of the leaf allocations, by node.
+        leaf_sums: Dict[int, Decimal] = {}
+        visited = set()
+
+        stack = [(ac, False) for ac in reversed(self.model.classes)]
+        while stack:
+            ac, children_done = stack.pop()
+
+            if children_done:
+                self.__validate_class(ac, leaf_sums)
+                continue
+
+            if id(ac) in visited:
+                self.report.add(IssueType.parent_cycle,
+                                f"{ac} is reached more than once in the tree.")
+                continue
+            visited.add(id(ac))
+
+            stack.append((ac, True))
+            for child in reversed(ac.classes):
+                stack.append((child, False))
+
+    def __validate_class(self, ac: AssetClass, leaf_sums: Dict[int, Decimal]):
+        """ Checks one class, once all the children have been processed """
+        if not ac.classes:
+            # This is not a branch but a leaf. Use own allocation.
+            leaf_sums[id(ac)] = ac.allocation
+            return
+
+        child_alloc_sum = Decimal(0)
+        for child in ac.classes:
+            child_alloc_sum += leaf_sums.get(id(child), Decimal(0))
+        leaf_sums[id(ac)] = child_alloc_sum
+
+        if ac.allocation != child_alloc_sum:
+            self.report.add(
+                IssueType.allocation_mismatch,
+                f"The sum of child allocations {child_alloc_sum:.2f} invalid for {ac}!")
+
+        if ac.stocks:
+            self.report.add(IssueType.mixed_class,
+                            f"{ac} contains both asset classes and stocks.")
+
+    def __validate_total(self):
+        """ The first-level allocations must add up to 100 """
+        total = Decimal(0)
+        for ac in self.model.classes:
+            total += ac.allocation
+        if total != Decimal(100):
+            self.report.add(IssueType.total_allocation,
+                            f"The sum of all allocations ({total:.2f}) does not equal 100!")
+
+    def __validate_detached_classes(self):
+        """ Classes the loader could not attach to the tree """
+        for ac_id in self.model.orphaned_class_ids:
+            self.report.add(IssueType.orphaned_class,
+                            f"Asset class {ac_id} has a parent that does not exist.")
+        for ac_id in self.model.cyclic_class_ids:
+            self.report.add(IssueType.parent_cycle,
+                            f"Asset class {ac_id} is in a parent cycle.")
+
+    def __validate_stocks(self):
+        """ Stock link checks """
+        counts: Dict[str, int] = {}
+        for stock in self.model.stocks:
+            if isinstance(stock, Stock):
+                counts[stock.symbol] = counts.get(stock.symbol, 0) + 1
+        for symbol, count in counts.items():
+            if count > 1:
+                self.report.add(IssueType.duplicate_symbol,
+                                f"{symbol} is linked {count} times.")
+
+        for symbol, ac_id in self.model.missing_class_links:
+            self.report.add(IssueType.missing_class,
+                            f"{symbol} is linked to asset class {ac_id}, which does not exist.")
+
+        for symbol in self.model.unpriced_symbols:
+            self.report.add(IssueType.missing_price, f"No price found for {symbol}.")
@@ -4,6 +4,10 @@ from decimal import Decimal
 
 class AssetAllocationViewModel:
     """ The view model for displaying Asset Allocation """
+    __slots__ = ("depth", "name", "set_allocation", "curr_allocation", "diff_allocation",
+                 "alloc_diff_perc", "set_value", "curr_value", "diff_value",
+                 "curr_value_own_currency", "own_currency")
+
     def __init__(self):
         # Depth / indentation level.
         self.depth = 0
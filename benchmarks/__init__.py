@@ -0,0 +1,4 @@
+"""
+Benchmarks. Not part of the distributed package.
+Run from the project root, i.e. `python -m benchmarks.memory`.
+"""
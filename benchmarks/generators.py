@@ -0,0 +1,214 @@
+"""
+Generators for synthetic benchmark data: the Asset Allocation database, the GnuCash book
+and the price database, with the config files pointing to them.
+The generated data is deterministic for the same parameters.
+"""
+import datetime
+import os
+import random
+import sqlite3
+import uuid
+from decimal import Decimal
+from typing import List
+
+NAMESPACE = "BENCH"
+# Currencies of the securities and of the cash accounts. The first one is the base currency.
+CURRENCIES = ["EUR", "USD", "AUD"]
+CASH_ROOT = "Investments:Cash"
+
+
+class Scale:
+    """ Size of the generated data set """
+    def __init__(self, name: str, depth: int, fan_out: int, links: int,
+                 transactions: int, days: int):
+        self.name = name
+        # Levels of asset classes below the root, and the children per class.
+        self.depth = depth
+        self.fan_out = fan_out
+        # Stock links. Each one is a separate security in the book.
+        self.links = links
+        # Transactions in the GnuCash book.
+        self.transactions = transactions
+        # Days of price history per security and currency.
+        self.days = days
+
+    def to_dict(self) -> dict:
+        """ For the results """
+        return dict(self.__dict__)
+
+
+SCALES = {
+    "small": Scale("small", depth=2, fan_out=3, links=50, transactions=500, days=30),
+    "medium": Scale("medium", depth=3, fan_out=4, links=500, transactions=5000, days=250),
+    "large": Scale("large", depth=4, fan_out=5, links=5000, transactions=50000, days=500),
+}
+
+
+def get_symbols(count: int) -> List[str]:
+    """ Symbols of the generated securities """
+    return [f"{NAMESPACE}:S{index:05}" for index in range(count)]
+
+
+def generate_dataset(directory: str, scale: Scale):
+    """
+    Creates all the databases and the config files in the directory.
+    Use the directory as the home directory when running the app.
+    """
+    os.makedirs(directory, exist_ok=True)
+    aa_path = os.path.join(directory, "asset_allocation.db")
+    book_path = os.path.join(directory, "book.gnucash")
+    prices_path = os.path.join(directory, "prices.db")
+    for path in [aa_path, book_path, prices_path]:
+        if os.path.exists(path):
+            os.remove(path)
+
+    symbols = get_symbols(scale.links)
+    generate_aa_database(aa_path, scale.depth, scale.fan_out, symbols)
+    generate_gnucash_book(book_path, symbols, scale.transactions)
+    generate_price_database(prices_path, symbols, scale.days)
+
+    with open(os.path.join(directory, "asset_allocation.ini"), mode="w") as ini_file:
+        ini_file.write(
+            "[Default]\n"
+            f"asset_allocation_database_path = {aa_path}\n"
+            f"gnucash_book_path = {book_path}\n"
+            f"default_currency = {CURRENCIES[0]}\n"
+            f"cash_root = {CASH_ROOT}\n")
+    with open(os.path.join(directory, "pricedb.ini"), mode="w") as ini_file:
+        ini_file.write(
+            "[Default]\n"
+            f"price_database = {prices_path}\n"
+            "alphavantage_api_key =\n"
+            "fixerio_api_key =\n")
+
+
+def generate_aa_database(db_path: str, depth: int, fan_out: int, symbols: List[str]):
+    """
+    Asset class tree with the given depth and fan-out, plus the Cash class.
+    The stock links are distributed over the leaf classes.
+    """
+    from asset_allocation import dal
+
+    session = dal.get_session(db_path)
+    classes = []
+    # (id, parent id, name, allocation, sort order)
+    cash_allocation = Decimal(10)
+    classes.append((1, None, "Cash", cash_allocation, fan_out))
+
+    level = [(None, Decimal(100) - cash_allocation, "")]
+    for _ in range(depth):
+        next_level = []
+        for parent_id, parent_allocation, parent_name in level:
+            allocation = parent_allocation / fan_out
+            for index in range(fan_out):
+                ac_id = len(classes) + 1
+                name = f"{parent_name}{index}" if parent_name else f"Class {index}"
+                classes.append((ac_id, parent_id, name, allocation, index))
+                next_level.append((ac_id, allocation, name + "."))
+        level = next_level
+    leaves = [ac_id for ac_id, _, _ in level]
+
+    session.execute(dal.AssetClass.__table__.insert(), [
+        {"id": ac_id, "parentid": parent_id, "name": name, "allocation": allocation,
+         "sortorder": sort_order}
+        for ac_id, parent_id, name, allocation, sort_order in classes])
+    session.execute(dal.AssetClassStock.__table__.insert(), [
+        {"assetclassid": leaves[index % len(leaves)], "symbol": symbol}
+        for index, symbol in enumerate(symbols)])
+    session.commit()
+    session.close()
+
+
+def generate_gnucash_book(book_path: str, symbols: List[str], transactions: int):
+    """
+    Book with one stock account per security and cash accounts per currency.
+    The accounts are created with piecash. The transactions are inserted directly,
+    in bulk, as creating them through the ORM is too slow for the larger scales.
+    """
+    from piecash import Account, Commodity, create_book
+
+    book = create_book(sqlite_file=book_path, currency=CURRENCIES[0], overwrite=True)
+    base = book.default_currency
+    currencies = {CURRENCIES[0]: base}
+    for mnemonic in CURRENCIES[1:]:
+        currencies[mnemonic] = Commodity(namespace="CURRENCY", mnemonic=mnemonic,
+                                         fullname=mnemonic, fraction=100, book=book)
+
+    bank = Account("Bank", "BANK", base, parent=book.root_account)
+    investments = Account("Investments", "ASSET", base, parent=book.root_account,
+                          placeholder=True)
+    cash_root = Account("Cash", "ASSET", base, parent=investments, placeholder=True)
+    cash_accounts = [Account(mnemonic, "BANK", commodity, parent=cash_root)
+                     for mnemonic, commodity in currencies.items()]
+    stock_accounts = []
+    for symbol in symbols:
+        namespace, mnemonic = symbol.split(":")
+        commodity = Commodity(namespace=namespace, mnemonic=mnemonic, fullname=mnemonic,
+                              fraction=1000, book=book)
+        stock_accounts.append(Account(mnemonic, "STOCK", commodity, parent=investments))
+    book.save()
+
+    base_guid = base.guid
+    bank_guid = bank.guid
+    cash_guids = [account.guid for account in cash_accounts]
+    stock_guids = [account.guid for account in stock_accounts]
+    book.close()
+
+    rng = random.Random(transactions)
+    start = datetime.datetime(2015, 1, 1, 10, 59)
+    transaction_rows = []
+    split_rows = []
+    for index in range(transactions):
+        tx_guid = uuid.uuid4().hex
+        post_date = (start + datetime.timedelta(days=index % 1500)).strftime("%Y-%m-%d %H:%M:%S")
+        transaction_rows.append((tx_guid, base_guid, "", post_date, post_date, "synthetic"))
+
+        amount = rng.randint(100, 100000)
+        if index % 10 == 0:
+            # Cash deposit.
+            account_guid = cash_guids[index % len(cash_guids)]
+            quantity, quantity_denom = amount, 100
+        else:
+            account_guid = stock_guids[index % len(stock_guids)]
+            quantity, quantity_denom = rng.randint(1000, 50000), 1000
+        split_rows.append((uuid.uuid4().hex, tx_guid, account_guid, "", "", "n", None,
+                           amount, 100, quantity, quantity_denom, None))
+        split_rows.append((uuid.uuid4().hex, tx_guid, bank_guid, "", "", "n", None,
+                           -amount, 100, -amount, 100, None))
+
+    connection = sqlite3.connect(book_path)
+    with connection:
+        connection.executemany("insert into transactions values (?, ?, ?, ?, ?, ?)",
+                               transaction_rows)
+        connection.executemany("insert into splits values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                               split_rows)
+    connection.close()
+
+
+def generate_price_database(db_path: str, symbols: List[str], days: int):
+    """ Daily prices for all the securities and the exchange rates into the base currency """
+    from pricedb import dal
+
+    # Create the schema.
+    dal.get_session(db_path).close()
+
+    rng = random.Random(days)
+    end = datetime.date(2020, 1, 1)
+    dates = [(end - datetime.timedelta(days=day)).isoformat() for day in range(days)]
+
+    series = []
+    for index, symbol in enumerate(symbols):
+        namespace, mnemonic = symbol.split(":")
+        series.append((namespace, mnemonic, CURRENCIES[index % len(CURRENCIES)]))
+    for mnemonic in CURRENCIES[1:]:
+        series.append(("CURRENCY", mnemonic, CURRENCIES[0]))
+
+    rows = ((namespace, mnemonic, price_date, "12:00:00", rng.randint(50, 20000), 100, currency)
+            for namespace, mnemonic, currency in series
+            for price_date in dates)
+    connection = sqlite3.connect(db_path)
+    with connection:
+        connection.executemany(
+            "insert into price (namespace, symbol, date, time, value, denom, currency) "
+            "values (?, ?, ?, ?, ?, ?, ?)", rows)
+    connection.close()
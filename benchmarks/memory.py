@@ -0,0 +1,111 @@
+"""
+Memory benchmark for the model and view-model objects.
+Builds a model with 10k holdings and compares the memory used by the slotted objects
+with the same attributes stored in instance dictionaries.
+
+Run from the project root: python -m benchmarks.memory [holdings]
+"""
+import sys
+import tracemalloc
+from decimal import Decimal
+
+from asset_allocation.maps import ModelMapper
+from asset_allocation.model import AssetAllocationModel, AssetClass, CashBalance, Stock
+from asset_allocation.view_model import AssetAllocationViewModel
+
+HOLDINGS = 10000
+HOLDINGS_PER_CLASS = 100
+
+
+def build_model(holdings: int) -> AssetAllocationModel:
+    """ Creates a calculated model with one level of classes holding the stocks """
+    model = AssetAllocationModel()
+    class_count = max(holdings // HOLDINGS_PER_CLASS, 1)
+    for index in range(class_count):
+        ac = AssetClass()
+        ac.id = index
+        ac.name = f"Class {index}"
+        ac.allocation = Decimal(100) / class_count
+        model.classes.append(ac)
+        model.add_asset_class(ac)
+
+    for index in range(holdings):
+        stock = Stock(f"NS:SYM{index}")
+        stock.quantity = Decimal(index + 1)
+        stock.price = Decimal("12.34")
+        stock.currency = "EUR"
+        stock.value_in_base_currency = stock.value
+        parent = model.asset_classes[index % class_count]
+        stock.parent = parent
+        parent.stocks.append(stock)
+        model.add_stock(stock)
+
+    model.recalculate()
+    return model
+
+
+def get_slot_names(obj) -> list:
+    """ All the slot attribute names of the object, mangled where needed """
+    names = []
+    for cls in type(obj).__mro__:
+        for name in getattr(cls, "__slots__", ()):
+            if name.startswith("__") and not name.endswith("__"):
+                name = f"_{cls.__name__.lstrip('_')}{name}"
+            names.append(name)
+    return names
+
+
+class _DictObject:
+    """ Holds the same attributes in an instance dictionary """
+    pass
+
+
+def as_dict_object(obj) -> _DictObject:
+    """ Copies the slot values into a dictionary-based object """
+    result = _DictObject()
+    for name in get_slot_names(obj):
+        setattr(result, name, getattr(obj, name))
+    return result
+
+
+def measure(factory, count: int) -> int:
+    """ Bytes allocated by creating the objects. The objects are kept until measured. """
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = [factory(index) for index in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objects
+    return after - before
+
+
+def main(holdings: int = HOLDINGS):
+    """ Print the memory use per object type """
+    model = build_model(holdings)
+    rows = ModelMapper(model).map_to_linear(with_stocks=True)
+
+    cash = CashBalance("EUR")
+    samples = [
+        ("Stock", model.stocks),
+        ("AssetClass", model.asset_classes),
+        ("CashBalance", [cash]),
+        ("AssetAllocationViewModel", rows),
+    ]
+
+    print(f"Model with {holdings:,} holdings, {len(model.asset_classes):,} classes, "
+          f"{len(rows):,} rows")
+    print(f"{'object':<26}{'count':>8}{'slots B':>10}{'dict B':>10}{'saved B':>10}{'saved total':>14}")
+    for name, items in samples:
+        count = len(items)
+        # The attribute values are shared, so only the containers are measured.
+        slotted = measure(lambda index: type(items[0]).__new__(type(items[0])), count)
+        dicts = measure(lambda index: as_dict_object(items[index % count]), count)
+        per_slotted = slotted / count
+        per_dict = dicts / count
+        saved = per_dict - per_slotted
+        print(f"{name:<26}{count:>8,}{per_slotted:>10.0f}{per_dict:>10.0f}{saved:>10.0f}"
+              f"{saved * count / 1024:>12,.0f} K")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else HOLDINGS)
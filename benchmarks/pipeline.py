@@ -0,0 +1,164 @@
+"""
+Benchmark of the full allocation pipeline on synthetic data.
+Generates the databases for each scale and times every stage of
+AppAggregate.get_asset_allocation separately, plus the formatting of the output.
+The results are printed as a table and can be saved as JSON.
+
+Run from the project root:
+    python -m benchmarks.pipeline [--scales small,medium] [--repeat 3] [--output results.json]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+from typing import Dict, List
+
+from benchmarks.generators import SCALES, Scale, generate_dataset
+
+# (stage name, loader method). In the same order as in get_asset_allocation.
+LOADER_STAGES = [
+    ("load_tree", "load_tree_from_db"),
+    ("load_stock_links", "load_stock_links"),
+    ("load_quantities", "load_stock_quantity"),
+    ("load_cash_balances", "load_cash_balances"),
+    ("load_prices", "load_stock_prices"),
+    ("recalculate_into_base", "recalculate_stock_values_into_base"),
+]
+
+
+def run_pipeline() -> Dict[str, float]:
+    """ Builds the model stage by stage and formats it. Returns the seconds per stage. """
+    from asset_allocation.formatters import AsciiFormatter
+    from asset_allocation.loader import AssetAllocationLoader
+
+    timings = {}
+    loader = AssetAllocationLoader(base_currency="EUR")
+    for stage, method in LOADER_STAGES:
+        start = time.perf_counter()
+        getattr(loader, method)()
+        timings[stage] = time.perf_counter() - start
+
+        if stage == "load_tree":
+            start = time.perf_counter()
+            loader.model.validate()
+            timings["validate"] = time.perf_counter() - start
+
+    loader.close_databases()
+
+    start = time.perf_counter()
+    loader.model.recalculate()
+    timings["recalculate_model"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    AsciiFormatter().format(loader.model, full=True)
+    timings["format"] = time.perf_counter() - start
+
+    timings["total"] = sum(timings.values())
+    return timings
+
+
+def time_full_load() -> Dict[str, float]:
+    """ The app entry point, without and with the model cache """
+    from asset_allocation.app import AppAggregate
+
+    timings = {}
+    start = time.perf_counter()
+    AppAggregate().get_asset_allocation(use_cache=False)
+    timings["get_asset_allocation"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    AppAggregate().get_asset_allocation(concurrent=True, use_cache=False)
+    timings["get_asset_allocation_concurrent"] = time.perf_counter() - start
+
+    # Populate the cache, then time the cached load.
+    AppAggregate().get_asset_allocation()
+    start = time.perf_counter()
+    AppAggregate().get_asset_allocation()
+    timings["get_asset_allocation_cached"] = time.perf_counter() - start
+    return timings
+
+
+def benchmark_scale(scale: Scale, directory: str, repeat: int) -> dict:
+    """ Generates the data and runs the pipeline. Returns the results for the scale. """
+    start = time.perf_counter()
+    generate_dataset(directory, scale)
+    generation_time = time.perf_counter() - start
+
+    # The app reads the config files from the home directory.
+    os.environ["HOME"] = directory
+
+    runs: List[Dict[str, float]] = []
+    for _ in range(repeat):
+        timings = run_pipeline()
+        timings.update(time_full_load())
+        runs.append(timings)
+
+    stages = {}
+    for stage in runs[0]:
+        values = [run[stage] for run in runs]
+        stages[stage] = {"median": statistics.median(values), "min": min(values),
+                         "max": max(values)}
+    return {
+        "scale": scale.to_dict(),
+        "generation_seconds": generation_time,
+        "repeat": repeat,
+        "stages": stages,
+    }
+
+
+def print_results(results: List[dict]):
+    """ Table with the median times, one column per scale """
+    names = [result["scale"]["name"] for result in results]
+    print(f"{'stage (median ms)':<34}" + "".join(f"{name:>12}" for name in names))
+    for stage in results[0]["stages"]:
+        row = f"{stage:<34}"
+        for result in results:
+            row += f"{result['stages'][stage]['median'] * 1000:>12.1f}"
+        print(row)
+
+
+def main(args: List[str] = None):
+    """ Runs the benchmark for the selected scales """
+    parser = argparse.ArgumentParser(description="Asset Allocation pipeline benchmark")
+    parser.add_argument("--scales", default="small,medium",
+                        help=f"Comma-separated scales: {', '.join(SCALES)}")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per scale")
+    parser.add_argument("--output", help="Save the results as JSON to this file")
+    parser.add_argument("--workdir", help="Directory for the generated data")
+    options = parser.parse_args(args)
+
+    warnings.filterwarnings("ignore")
+    workdir = options.workdir or tempfile.mkdtemp(prefix="aa-benchmark-")
+    home = os.environ.get("HOME")
+
+    results = []
+    try:
+        for name in options.scales.split(","):
+            scale = SCALES[name.strip()]
+            directory = os.path.join(workdir, scale.name)
+            results.append(benchmark_scale(scale, directory, options.repeat))
+    finally:
+        if home is not None:
+            os.environ["HOME"] = home
+
+    print_results(results)
+
+    if options.output:
+        content = {
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "results": results,
+        }
+        with open(options.output, mode="w") as output_file:
+            json.dump(content, output_file, indent=2)
+        print(f"Results saved to {options.output}")
+
+
+if __name__ == "__main__":
+    main()
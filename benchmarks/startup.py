@@ -0,0 +1,76 @@
+"""
+CLI startup benchmark.
+Runs `--help` for every command and sub-command in a fresh interpreter and reports
+the wall time, and whether the heavy GnuCash / price database modules were imported.
+`--help` exercises the import and command resolution without touching the databases.
+
+Run from the project root: python -m benchmarks.startup [runs]
+"""
+import statistics
+import subprocess
+import sys
+import time
+from typing import List
+
+import click
+
+RUNS = 5
+# Modules that only the commands working with the book and prices should import.
+HEAVY_MODULES = ["asset_allocation.loader", "gnucash_portfolio", "piecash", "pricedb"]
+
+# Invokes the cli and then reports which of the heavy modules got imported.
+RUNNER = """
+import sys
+from asset_allocation.cli import cli
+try:
+    cli(sys.argv[1:])
+except SystemExit:
+    pass
+heavy = [name for name in {heavy} if name in sys.modules]
+sys.stderr.write("heavy:" + ",".join(heavy))
+"""
+
+
+def get_command_paths(command: click.Command, path: List[str] = None) -> List[List[str]]:
+    """ All the command paths in the cli tree, i.e. [], ["ac"], ["ac", "list"] """
+    path = path or []
+    result = [path]
+    if isinstance(command, click.Group):
+        ctx = click.Context(command)
+        for name in command.list_commands(ctx):
+            child = command.get_command(ctx, name)
+            result.extend(get_command_paths(child, path + [name]))
+    return result
+
+
+def time_command(path: List[str], runs: int):
+    """ Returns the wall times and the heavy modules imported for the command """
+    code = RUNNER.format(heavy=HEAVY_MODULES)
+    args = [sys.executable, "-c", code] + path + ["--help"]
+    timings = []
+    heavy = ""
+    for _ in range(runs):
+        start = time.perf_counter()
+        process = subprocess.run(args, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                 universal_newlines=True)
+        timings.append(time.perf_counter() - start)
+        heavy = process.stderr.rpartition("heavy:")[2].strip()
+    return timings, heavy
+
+
+def main():
+    """ Times all the commands """
+    from asset_allocation.cli import cli
+
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else RUNS
+
+    print(f"{'command':<24} {'median':>8} {'min':>8}  heavy imports")
+    for path in get_command_paths(cli):
+        timings, heavy = time_command(path, runs)
+        name = " ".join(["aa"] + path)
+        print(f"{name:<24} {statistics.median(timings) * 1000:>6.0f}ms "
+              f"{min(timings) * 1000:>6.0f}ms  {heavy or '-'}")
+
+
+if __name__ == "__main__":
+    main()
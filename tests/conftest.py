@@ -1,6 +1,6 @@
 """ Test configuration """
 import pytest
-from asset_allocation.config import Config
+from asset_allocation.config import Config, get_config
 
 # @pytest.fixture(scope="session")
 # def settings_db() -> Settings:
@@ -24,6 +24,37 @@ def config():
     """ Test configuration """
     return Config("data/asset_allocation.ini")
 
+@pytest.fixture
+def temp_config(tmp_path) -> Config:
+    """ Configuration pointing to an empty, temporary Asset Allocation database """
+    ini_path = tmp_path / "asset_allocation.ini"
+    ini_path.write_text(
+        "[Default]\n"
+        f"asset_allocation_database_path = {tmp_path / 'asset_allocation.db'}\n"
+        "gnucash_book_path = data/test.gnucash\n"
+        "default_currency = EUR\n"
+        "cash_root = Assets:Investments\n")
+    return Config(str(ini_path))
+
+@pytest.fixture
+def user_config(temp_config, tmp_path, monkeypatch) -> Config:
+    """ The temporary configuration, used as the user's config file in a temporary home """
+    monkeypatch.setenv("HOME", str(tmp_path))
+    return temp_config
+
+@pytest.fixture
+def dataset(tmp_path, monkeypatch) -> Config:
+    """
+    A small generated data set in a temporary home directory: the Asset Allocation database,
+    the GnuCash book, the price database and the user's config files pointing to them.
+    """
+    from benchmarks.generators import Scale, generate_dataset
+
+    scale = Scale("test", depth=1, fan_out=2, links=4, transactions=40, days=3)
+    generate_dataset(str(tmp_path), scale)
+    monkeypatch.setenv("HOME", str(tmp_path))
+    return get_config()
+
 
 class TestSettings(object):
     """
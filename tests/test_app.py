@@ -1,15 +1,120 @@
 """
 Test the main app functionality
 """
+import sqlite3
+from decimal import Decimal
+
+from asset_allocation import dal
 from asset_allocation.app import AppAggregate
+from asset_allocation.config import ConfigKeys
 
 #def test_asset_allocation_tree_generation():
     # """ Create an asset allocation tree """
 
-def test_open_db():
+def test_open_db(user_config):
     """ Open db connection from the app """
     app = AppAggregate()
     session = app.open_session()
     session.close()
 
     assert session != None
+
+def get_latest_price(prices_path: str, symbol: str) -> Decimal:
+    """ Reads the latest price from the generated price database """
+    namespace, mnemonic = symbol.split(":")
+    connection = sqlite3.connect(prices_path)
+    value, denom = connection.execute(
+        "select value, denom from price where namespace = ? and symbol = ? "
+        "order by date desc, time desc limit 1", (namespace, mnemonic)).fetchone()
+    connection.close()
+    return Decimal(value) / Decimal(denom)
+
+def test_unallocated_holdings(dataset, tmp_path):
+    """ Holdings without a stock link, valued in the base currency, unpriced last """
+    from benchmarks.generators import generate_gnucash_book, get_symbols
+    from asset_allocation.stocks import StocksInfo
+
+    # Two more securities in the book, without links or prices.
+    generate_gnucash_book(str(dataset.get(ConfigKeys.gnucash_book_path)), get_symbols(6), 60)
+    db_path = dataset.get(ConfigKeys.asset_allocation_database_path)
+    with dal.session_scope(db_path) as session:
+        session.query(dal.AssetClassStock).filter(
+            dal.AssetClassStock.symbol.in_(["BENCH:S00000", "BENCH:S00001"])
+        ).delete(synchronize_session=False)
+    stocks = StocksInfo(dataset)
+    balances = stocks.load_security_balances()
+    stocks.close_databases()
+
+    actual = AppAggregate().find_unallocated_holdings()
+
+    prices_path = str(tmp_path / "prices.db")
+    # S00000 is priced in EUR, the base currency, and S00001 in USD.
+    values = {
+        "BENCH:S00000": balances["BENCH:S00000"] * get_latest_price(prices_path, "BENCH:S00000"),
+        "BENCH:S00001": balances["BENCH:S00001"] * get_latest_price(prices_path, "BENCH:S00001")
+                        * get_latest_price(prices_path, "CURRENCY:USD"),
+    }
+    priced = sorted(values, key=values.get, reverse=True)
+    assert [holding.symbol for holding in actual] == priced + ["BENCH:S00004", "BENCH:S00005"]
+    for holding in actual:
+        assert holding.quantity == balances[holding.symbol]
+        assert holding.value_in_base_currency == values.get(holding.symbol)
+
+def test_refresh_prices(dataset, tmp_path):
+    """ Refreshed models have the same prices, rates and values as a full reload """
+    app = AppAggregate()
+    model = app.get_asset_allocation()
+    loader = app.loader
+    cached_app = AppAggregate()
+    cached = cached_app.get_asset_allocation()
+    assert cached is not model
+    assert cached_app.loader is None
+
+    # A new price for the security in USD, and a new rate for USD.
+    connection = sqlite3.connect(str(tmp_path / "prices.db"))
+    with connection:
+        connection.executemany(
+            "insert into price (namespace, symbol, date, time, value, denom, currency) "
+            "values (?, ?, ?, ?, ?, ?, ?)",
+            [("BENCH", "S00001", "2020-01-02", "12:00:00", 12345, 100, "USD"),
+             ("CURRENCY", "USD", "2020-01-02", "12:00:00", 80, 100, "EUR")])
+    connection.close()
+
+    refreshed = app.refresh_prices(model)
+    refreshed_cached = cached_app.refresh_prices(cached)
+    expected = AppAggregate().get_asset_allocation(use_cache=False)
+
+    # The loader of the loaded model is kept. One is created for the cached model.
+    assert refreshed is model and app.loader is loader
+    assert refreshed_cached is cached and cached_app.loader.model is cached
+    assert expected.exchange_rates["USD"] == Decimal("0.8")
+    assert expected.get_stocks_by_symbol("BENCH:S00001")[0].price == Decimal("123.45")
+    for actual in [refreshed, refreshed_cached]:
+        assert actual.exchange_rates == expected.exchange_rates
+        assert [(stock.symbol, stock.price, stock.value_in_base_currency)
+                for stock in actual.stocks] == \
+            [(stock.symbol, stock.price, stock.value_in_base_currency)
+             for stock in expected.stocks]
+        assert [ac.curr_value for ac in actual.asset_classes] == \
+            [ac.curr_value for ac in expected.asset_classes]
+        assert actual.total_amount == expected.total_amount
+
+def test_concurrent_loading(dataset):
+    """ The concurrent loading gives the same model as the sequential one """
+    from asset_allocation.model import CashBalance
+
+    sequential = AppAggregate().get_asset_allocation(use_cache=False)
+    concurrent = AppAggregate().get_asset_allocation(concurrent=True, use_cache=False)
+
+    def get_holdings(model):
+        return [(type(stock), stock.symbol, getattr(stock, "quantity", None), stock.price,
+                 stock.currency, stock.value, stock.value_in_base_currency)
+                for stock in model.stocks]
+
+    assert get_holdings(concurrent) == get_holdings(sequential)
+    cash = [stock for stock in sequential.stocks if isinstance(stock, CashBalance)]
+    assert len(cash) == 3
+    assert all(item.price is None for item in cash)
+    assert [ac.curr_value for ac in concurrent.asset_classes] == \
+        [ac.curr_value for ac in sequential.asset_classes]
+    assert concurrent.unpriced_symbols == sequential.unpriced_symbols
@@ -0,0 +1,45 @@
+""" Tests for the model cache """
+from decimal import Decimal
+
+from asset_allocation.cache import ModelCache
+from asset_allocation.config import Config, ConfigKeys
+from asset_allocation.model import AssetAllocationModel, AssetClass
+
+
+def test_cached_model(temp_config: Config, tmp_path):
+    """ The model is returned from the cache while the data does not change """
+    cache = ModelCache(temp_config, str(tmp_path / "aa.cache"))
+    model = AssetAllocationModel()
+    ac = AssetClass()
+    ac.name = "Equity"
+    ac.curr_value = Decimal("12.34")
+    model.classes.append(ac)
+
+    cache.save(model)
+    actual = cache.load()
+
+    assert actual.classes[0].name == "Equity"
+    assert actual.classes[0].curr_value == Decimal("12.34")
+
+def test_changed_data(temp_config: Config, tmp_path):
+    """ Changing a source database invalidates the cache """
+    cache = ModelCache(temp_config, str(tmp_path / "aa.cache"))
+    db_path = temp_config.get(ConfigKeys.asset_allocation_database_path)
+    with open(db_path, mode="w") as db_file:
+        db_file.write("a")
+
+    cache.save(AssetAllocationModel())
+    with open(db_path, mode="w") as db_file:
+        db_file.write("changed")
+
+    assert cache.load() is None
+
+def test_new_day(temp_config: Config, tmp_path):
+    """ The cached model is not used on another day """
+    cache = ModelCache(temp_config, str(tmp_path / "aa.cache"))
+    fingerprint = cache.get_fingerprint()
+    yesterday = fingerprint[:-1] + ("2000-01-01",)
+
+    cache.save(AssetAllocationModel(), yesterday)
+
+    assert cache.load() is None
@@ -0,0 +1,41 @@
+""" Command line tests """
+import subprocess
+import sys
+
+
+def test_help_is_lazy():
+    """ The help does not import the GnuCash and price database stack """
+    code = (
+        "import sys\n"
+        "from asset_allocation.cli import cli\n"
+        "try:\n"
+        "    cli(['--help'])\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        "print([name for name in ('asset_allocation.loader', 'piecash', 'pricedb') if name in sys.modules])\n"
+    )
+    output = subprocess.run([sys.executable, "-c", code], stdout=subprocess.PIPE,
+                            universal_newlines=True, check=True).stdout
+
+    assert "Commands:" in output
+    assert output.strip().endswith("[]")
+
+
+def test_json_profile_with_trace(tmp_path, capsys, caplog):
+    """ With the trace saved, the profile in json is still the only output on stderr """
+    import json
+    import logging
+    from asset_allocation import profiling
+    from asset_allocation.cli import print_profile
+
+    # As with --verbosity INFO.
+    caplog.set_level(logging.INFO, logger="asset_allocation.cli")
+    profiler = profiling.enable()
+    with profiling.stage("load"):
+        pass
+    trace_path = tmp_path / "trace.json"
+
+    print_profile(profiler, "json", str(trace_path))
+
+    assert json.loads(capsys.readouterr().err)
+    assert trace_path.exists()
@@ -2,7 +2,7 @@
 
 import os
 from logging import log, DEBUG
-from asset_allocation.config import Config
+from asset_allocation.config import Config, ConfigKeys, get_config
 from configparser import ConfigParser
 
 def test_get_config_location():
@@ -40,3 +40,19 @@ def test_user_config_created():
     cfg = Config()
     ini_path = cfg.get_config_path()
     assert ini_path is not None
+
+def test_shared_config(tmp_path):
+    """ The config is parsed once and read again only when the file changes """
+    ini_path = tmp_path / "asset_allocation.ini"
+    ini_path.write_text("[Default]\ndefault_currency = EUR\n")
+
+    cfg = get_config(str(ini_path))
+    assert get_config(str(ini_path)) is cfg
+    assert cfg.get(ConfigKeys.default_currency) == "EUR"
+
+    modified = ini_path.stat().st_mtime
+    ini_path.write_text("[Default]\ndefault_currency = CHF\n")
+    # The same size. Set a later time, in case the file system has coarse timestamps.
+    os.utime(ini_path, (modified + 10, modified + 10))
+
+    assert get_config(str(ini_path)).get(ConfigKeys.default_currency) == "CHF"
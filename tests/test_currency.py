@@ -0,0 +1,27 @@
+""" Tests for currency conversion """
+from decimal import Decimal
+from asset_allocation.currency import CurrencyConverter
+
+
+def test_rate_cache(tmp_path):
+    """ Rates for all currencies are loaded at once and kept until invalidated """
+    from pricedb import dal
+
+    session = dal.get_session(str(tmp_path / "prices.db"))
+    session.add(dal.Price(namespace="CURRENCY", symbol="USD", date="2018-01-01",
+                          time="00:00:00", value=80, denom=100, currency="EUR"))
+    session.add(dal.Price(namespace="CURRENCY", symbol="USD", date="2018-01-02",
+                          time="00:00:00", value=85, denom=100, currency="EUR"))
+    session.add(dal.Price(namespace="CURRENCY", symbol="GBP", date="2018-01-01",
+                          time="00:00:00", value=110, denom=100, currency="EUR"))
+    session.commit()
+
+    conv = CurrencyConverter(session)
+    conv.load_currencies(["USD", "GBP", "USD"])
+
+    assert conv.rates["USD"].value == Decimal("0.85")
+    conv.load_currency("GBP")
+    assert conv.rate.value == Decimal("1.1")
+
+    conv.invalidate()
+    assert not conv.rates
@@ -2,10 +2,42 @@
 from asset_allocation import dal
 from asset_allocation.config import Config, ConfigKeys
 
-def test_connect_to_db():
+def test_connect_to_db(user_config):
     """ Try to open database """
     cfg = Config()
     db_path = cfg.get(ConfigKeys.asset_allocation_database_path)
 
     session = dal.get_session(db_path)
     print(session)
+
+def test_engine_reused(tmp_path):
+    """ Sessions for the same database share one engine """
+    db_path = str(tmp_path / "aa.db")
+
+    first = dal.get_session(db_path)
+    second = dal.get_session(db_path)
+
+    assert first is not second
+    assert first.get_bind() is second.get_bind()
+
+def test_engine_uses_absolute_path(tmp_path, monkeypatch):
+    """ The shared engine keeps to its file when the working directory changes """
+    monkeypatch.chdir(tmp_path)
+    engine = dal.get_engine("relative.db")
+    (tmp_path / "other").mkdir()
+    monkeypatch.chdir(tmp_path / "other")
+
+    assert engine.url.database == str(tmp_path / "relative.db")
+    assert dal.get_engine(str(tmp_path / "relative.db")) is engine
+
+def test_session_scope(tmp_path):
+    """ Changes in the scope are committed """
+    db_path = str(tmp_path / "aa.db")
+
+    with dal.session_scope(db_path) as session:
+        item = dal.AssetClass()
+        item.name = "Equity"
+        session.add(item)
+
+    with dal.session_scope(db_path) as session:
+        assert session.query(dal.AssetClass).count() == 1
@@ -5,7 +5,7 @@
 from asset_allocation import AppAggregate, AsciiFormatter
 
 
-def test_text_output():
+def test_text_output(user_config):
     """ Test the generation of asset allocation cli output """
     # runner = CliRunner()
     # result = runner.invoke(cli.show, ["ascii", False])
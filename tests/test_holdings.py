@@ -0,0 +1,47 @@
+""" Tests for the columnar holdings engine """
+from decimal import Decimal
+
+import pytest
+
+from asset_allocation.holdings import HoldingsTable
+from asset_allocation.model import CashBalance, Stock
+
+
+def create_stock(symbol: str, quantity: str, price: str, currency: str) -> Stock:
+    """ Stock with the price """
+    stock = Stock(symbol)
+    stock.quantity = Decimal(quantity)
+    stock.price = Decimal(price)
+    stock.currency = currency
+    return stock
+
+def test_values_match_decimal():
+    """ The values are identical to the Decimal calculation """
+    rates = {"USD": Decimal("0.8512"), "AUD": Decimal("0.612345")}
+    stocks = [
+        create_stock("NYSE:VTI", "12.625", "150.25", "USD"),
+        create_stock("ASX:VHY", "1000", "60.1234", "AUD"),
+        create_stock("XETRA:EXS1", "3", "110.5", "EUR"),
+    ]
+    cash = CashBalance("USD")
+    cash.currency = "USD"
+    cash.value = Decimal("300.10")
+    stocks.append(cash)
+
+    table = HoldingsTable(stocks, rates, "EUR")
+    table.calculate()
+    table.apply()
+
+    expected = Decimal(0)
+    for stock in stocks:
+        rate = rates.get(stock.currency, Decimal(1))
+        assert stock.value_in_base_currency == stock.value * rate
+        expected += stock.value * rate
+    assert table.get_total_in_base() == expected
+
+def test_invalid_value():
+    """ A value that is not a finite number is reported with the symbol """
+    stocks = [create_stock("NYSE:VTI", "NaN", "150.25", "EUR")]
+
+    with pytest.raises(ValueError, match="quantity for NYSE:VTI"):
+        HoldingsTable(stocks, {}, "EUR")
@@ -0,0 +1,83 @@
+""" Tests for the bulk csv import """
+import io
+
+from asset_allocation import dal
+from asset_allocation.importer import CsvImporter
+
+
+def create_importer(tmp_path, entity=dal.AssetClassStock,
+                    key=("assetclassid", "symbol")) -> CsvImporter:
+    """ Importer into an empty database """
+    session = dal.get_session(str(tmp_path / "aa.db"))
+    return CsvImporter(session, entity, key=key, batch_size=2)
+
+def test_import_in_batches(tmp_path):
+    """ All the rows are saved, in batches """
+    importer = create_importer(tmp_path)
+    lines = "assetclassid,symbol\n1,NYSE:VTI\n1,'ASX:VHY'\n2,NYSE:BND\n"
+
+    report = importer.import_rows(io.StringIO(lines))
+
+    assert report.is_valid
+    assert report.inserted == 3
+    symbols = [link.symbol for link in importer.session.query(dal.AssetClassStock)]
+    assert symbols == ["NYSE:VTI", "ASX:VHY", "NYSE:BND"]
+
+def test_invalid_rows_reported(tmp_path):
+    """ The errors have the line numbers and nothing is saved """
+    importer = create_importer(tmp_path)
+    lines = "assetclassid,symbol\n1,NYSE:VTI\nx,NYSE:BND\n1,ASX:VHY\n2\n"
+
+    report = importer.import_rows(io.StringIO(lines))
+
+    assert [error.line for error in report.errors] == [3, 5]
+    assert importer.session.query(dal.AssetClassStock).count() == 0
+
+def test_upsert(tmp_path):
+    """ Existing records are updated on the key column """
+    importer = create_importer(tmp_path, dal.AssetClass, key="name")
+    importer.import_rows(io.StringIO("name,allocation\nEquity,60\nBonds,40\n"))
+
+    importer.upsert = True
+    report = importer.import_rows(io.StringIO("name,allocation\nEquity,70\nCash,10\n"))
+
+    assert (report.inserted, report.updated) == (1, 1)
+    equity = importer.session.query(dal.AssetClass).filter(dal.AssetClass.name == "Equity").one()
+    assert equity.allocation == 70
+    assert importer.session.query(dal.AssetClass).count() == 3
+
+def test_dry_run(tmp_path):
+    """ Dry run validates without saving """
+    importer = create_importer(tmp_path)
+    importer.dry_run = True
+
+    report = importer.import_rows(io.StringIO("assetclassid,symbol\n1,NYSE:VTI\n"))
+
+    assert report.is_valid
+    assert report.inserted == 1
+    assert importer.session.query(dal.AssetClassStock).count() == 0
+
+def test_dry_run_constraints(tmp_path):
+    """ Dry run reports the rows that the database would reject """
+    importer = create_importer(tmp_path, dal.AssetClass, key="name")
+    importer.dry_run = True
+
+    lines = "name,allocation\nEquity,60\nBonds,30\nEquity,10\n"
+
+    report = importer.import_rows(io.StringIO(lines))
+
+    assert not report.is_valid
+    assert importer.session.query(dal.AssetClass).count() == 0
+
+def test_upsert_links(tmp_path):
+    """ Links are matched on the class and the symbol, in key lookups of any size """
+    importer = create_importer(tmp_path)
+    importer.batch_size = 1000
+    lines = "assetclassid,symbol\n" + "".join(f"{index % 2},S{index}\n" for index in range(1000))
+    importer.import_rows(io.StringIO(lines))
+
+    importer.upsert = True
+    report = importer.import_rows(io.StringIO(lines + "1,S0\n"))
+
+    assert (report.inserted, report.updated) == (1, 1000)
+    assert importer.session.query(dal.AssetClassStock).count() == 1001
@@ -7,7 +7,7 @@ from asset_allocation.config import Config, ConfigKeys
 from asset_allocation.loader import AssetAllocationLoader
 from asset_allocation.model import AssetAllocationModel
 
-def test_creation():
+def test_creation(user_config):
     """ Load correct types and something returned """
     x = AssetAllocationLoader()
     actual = x.load_tree_from_db()
@@ -26,3 +26,62 @@ def test_loading_records(config: Config):
     actual = x.load_tree_from_db()
 
     assert len(actual.classes) == 2
+
+def add_class(session, id: int, parentid: int, name: str, sortorder: int):
+    """ Inserts an asset class record """
+    from asset_allocation import dal
+
+    item = dal.AssetClass()
+    item.id = id
+    item.parentid = parentid
+    item.name = name
+    item.allocation = 0
+    item.sortorder = sortorder
+    session.add(item)
+
+def test_single_query_tree(temp_config: Config):
+    """ The tree built from one query matches the per-node loading """
+    from asset_allocation import dal
+
+    session = dal.get_session(temp_config.get(ConfigKeys.asset_allocation_database_path))
+    add_class(session, 1, None, "Equity", 2)
+    add_class(session, 2, None, "Cash", 1)
+    add_class(session, 3, 1, "International", 2)
+    add_class(session, 4, 1, "Domestic", 1)
+    add_class(session, 5, 4, "Small", 1)
+    session.commit()
+
+    x = AssetAllocationLoader(config=temp_config)
+    actual = x.load_tree_from_db()
+    expected = x.load_tree_from_db(single_query=False)
+
+    assert [ac.name for ac in actual.classes] == ["Cash", "Equity"]
+    assert [ac.name for ac in actual.asset_classes] == \
+        [ac.name for ac in expected.asset_classes]
+    assert [ac.depth for ac in actual.asset_classes] == \
+        [ac.depth for ac in expected.asset_classes]
+    assert [ac.fullname for ac in actual.asset_classes] == \
+        [ac.fullname for ac in expected.asset_classes]
+
+    small = actual.get_class_by_id(5)
+    assert small.parent is actual.get_class_by_id(4)
+    assert small.parent.parent is actual.get_class_by_id(1)
+    assert small.parent.parent.parent is None
+    assert small.fullname == "Equity:Domestic:Small"
+
+def test_detached_classes(temp_config: Config):
+    """ Orphaned classes and parent cycles are reported, not loaded """
+    from asset_allocation import dal
+
+    session = dal.get_session(temp_config.get(ConfigKeys.asset_allocation_database_path))
+    add_class(session, 1, None, "Equity", 1)
+    add_class(session, 2, 99, "Orphan", 1)
+    add_class(session, 3, 4, "Cycle A", 1)
+    add_class(session, 4, 3, "Cycle B", 1)
+    session.commit()
+
+    actual = AssetAllocationLoader(config=temp_config).load_tree_from_db()
+
+    assert len(actual.asset_classes) == 1
+    assert actual.orphaned_class_ids == [2]
+    assert sorted(actual.cyclic_class_ids) == [3, 4]
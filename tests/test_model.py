@@ -6,3 +6,133 @@ def test_asset_class():
     obj = AssetClass()
     #obj.name
     assert obj != None
+
+def test_recalculate_twice():
+    """ Recalculating the values gives the same result """
+    from decimal import Decimal
+    from asset_allocation.model import AssetAllocationModel, Stock
+
+    model = AssetAllocationModel()
+    parent = AssetClass()
+    parent.allocation = Decimal(100)
+    child = AssetClass()
+    child.allocation = Decimal(100)
+    parent.classes.append(child)
+    stock = Stock("VTI")
+    stock.value_in_base_currency = Decimal(50)
+    child.stocks.append(stock)
+    model.classes.append(parent)
+    model.add_asset_class(parent)
+    model.add_asset_class(child)
+
+    model.recalculate()
+    model.recalculate()
+
+    assert parent.curr_value == Decimal(50)
+    assert model.total_amount == Decimal(50)
+    assert parent.curr_alloc == Decimal(100)
+
+def test_indexes():
+    """ Asset classes and stocks are found through the indexes """
+    from asset_allocation.model import AssetAllocationModel, Stock
+
+    model = AssetAllocationModel()
+    cash = AssetClass()
+    cash.id = 3
+    cash.name = "Cash"
+    model.add_asset_class(cash)
+    stock = Stock("NYSE:VTI")
+    model.add_stock(stock)
+
+    assert model.get_class_by_id(3) is cash
+    assert model.get_cash_asset_class() is cash
+    assert model.get_stocks_by_symbol("NYSE:VTI") == [stock]
+    assert model.get_stocks_by_symbol("VTI") == []
+
+def test_paths():
+    """ Paths are cached and follow re-parenting """
+    from asset_allocation.model import Stock
+
+    equity = AssetClass()
+    equity.name = "Equity"
+    bonds = AssetClass()
+    bonds.name = "Bonds"
+    intl = AssetClass()
+    intl.name = "International"
+    intl.parent = equity
+    equity.classes.append(intl)
+    stock = Stock("VTI")
+    stock.parent = intl
+    intl.stocks.append(stock)
+
+    assert intl.fullname == "Equity:International"
+    assert stock.asset_class == "Equity:International"
+
+    intl.parent = bonds
+    assert intl.fullname == "Bonds:International"
+    assert stock.asset_class == "Bonds:International"
+
+def test_deep_tree_values():
+    """ Values roll up through a deep tree without recursion """
+    from decimal import Decimal
+    from asset_allocation.model import AssetAllocationModel, Stock
+
+    model = AssetAllocationModel()
+    parent = None
+    for level in range(2000):
+        ac = AssetClass()
+        ac.allocation = Decimal(100)
+        if parent:
+            parent.classes.append(ac)
+        else:
+            model.classes.append(ac)
+        model.add_asset_class(ac)
+        parent = ac
+    stock = Stock("VTI")
+    stock.value_in_base_currency = Decimal(10)
+    parent.stocks.append(stock)
+
+    model.recalculate()
+
+    assert model.classes[0].curr_value == Decimal(10)
+    assert model.classes[0].alloc_value == Decimal(10)
+
+def test_reparenting():
+    """ Moving a class to another parent updates the lookups and the values """
+    from decimal import Decimal
+    from asset_allocation.model import AssetAllocationModel, Stock
+
+    model = AssetAllocationModel()
+    first, second, child = AssetClass(), AssetClass(), AssetClass()
+    for ac, name in [(first, "Equity"), (second, "Fixed"), (child, "Bonds")]:
+        ac.name = name
+        ac.allocation = Decimal(50)
+        model.add_asset_class(ac)
+    model.classes = [first, second]
+    child.parent = first
+    first.classes.append(child)
+    stock = Stock("AGG")
+    stock.value_in_base_currency = Decimal(10)
+    child.stocks.append(stock)
+    model.recalculate()
+    assert model.get_class_by_fullname("Equity:Bonds") is child
+
+    first.classes.remove(child)
+    second.classes.append(child)
+    child.parent = second
+    model.recalculate()
+
+    assert model.get_class_by_fullname("Fixed:Bonds") is child
+    assert model.get_class_by_fullname("Equity:Bonds") is None
+    assert (first.curr_value, second.curr_value) == (Decimal(0), Decimal(10))
+
+    # A class of another model does not change this one.
+    other = AssetClass()
+    other.name = "Other"
+    AssetAllocationModel().add_asset_class(other)
+    other.parent = second
+    assert model.get_class_by_fullname("Fixed:Other") is None
+
+    second.name = "Bonds and Cash"
+    second.invalidate_path()
+    assert model.get_class_by_fullname("Bonds and Cash:Bonds") is child
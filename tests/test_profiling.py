@@ -0,0 +1,50 @@
+""" Tests for the stage instrumentation """
+from asset_allocation import dal, profiling
+
+
+def test_stages_recorded(tmp_path):
+    """ Time, statements and rows are recorded per stage """
+    # The engine exists before profiling starts.
+    session = dal.get_session(str(tmp_path / "aa.db"))
+    profiler = profiling.enable()
+    try:
+        with profiling.stage("outer"):
+            with profiling.stage("query"):
+                session.query(dal.AssetClass).all()
+                session.query(dal.AssetClassStock).all()
+                profiling.add_rows(3)
+    finally:
+        profiling.disable()
+
+    outer, query = profiler.spans
+    assert (outer.name, outer.depth, outer.statement_count) == ("outer", 0, 0)
+    assert query.depth == 1
+    assert query.statements == {"aa.db": 2}
+    assert query.rows == 3
+    assert query.duration <= outer.duration
+    assert "query" in profiler.format()
+
+def test_disabled():
+    """ Nothing is recorded without a profiler """
+    with profiling.stage("ignored"):
+        profiling.add_rows(1)
+
+    assert profiling.get_profiler() is None
+
+def test_chrome_trace(tmp_path):
+    """ The spans are saved as complete trace events, with the attributes """
+    profiler = profiling.enable()
+    try:
+        with profiling.stage("price", symbol="NYSE:VTI"):
+            pass
+    finally:
+        profiling.disable()
+    trace_path = tmp_path / "trace.json"
+
+    profiler.save_trace(str(trace_path))
+
+    import json
+    event = json.loads(trace_path.read_text())["traceEvents"][0]
+    assert (event["name"], event["ph"]) == ("price", "X")
+    assert event["args"] == {"symbol": "NYSE:VTI"}
+    assert "slowest" in profiler.format()
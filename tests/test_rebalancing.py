@@ -0,0 +1,213 @@
+""" Rebalancing trade tests """
+
+from decimal import Decimal
+
+from asset_allocation.model import AssetAllocationModel, AssetClass, Stock
+from asset_allocation.rebalancing import ContributionAllocator, Rebalancer
+
+
+def create_model() -> AssetAllocationModel:
+    """ Equity over-allocated by 200, Bonds under-allocated by 200, Cash on target """
+    model = AssetAllocationModel()
+    model.currency = "EUR"
+    for name, allocation, symbol, price, quantity in [
+            ("Equity", 60, "VTI", 10, 80), ("Bonds", 30, "AGG", 25, 4), ("Cash", 10, None, 0, 0)]:
+        ac = AssetClass()
+        ac.name = name
+        ac.allocation = Decimal(allocation)
+        model.classes.append(ac)
+        model.add_asset_class(ac)
+        if symbol:
+            stock = Stock(symbol)
+            stock.price = Decimal(price)
+            stock.currency = "EUR"
+            stock.quantity = Decimal(quantity)
+            stock.value_in_base_currency = stock.price * stock.quantity
+            stock.parent = ac
+            ac.stocks.append(stock)
+            model.add_stock(stock)
+    cash = Stock("CASH")
+    cash.value_in_base_currency = Decimal(100)
+    model.classes[2].stocks.append(cash)
+    model.recalculate()
+    return model
+
+
+def test_trades():
+    """ Sells the over-allocated class and buys the under-allocated one, in whole shares """
+    plan = Rebalancer(create_model()).rebalance()
+
+    trades = {trade.symbol: trade for trade in plan.trades}
+    assert trades["VTI"].quantity == Decimal(-20)
+    assert trades["VTI"].action == "sell"
+    assert trades["AGG"].quantity == Decimal(8)
+    assert trades["AGG"].asset_class == "Bonds"
+    assert plan.cash_flow == Decimal(0)
+
+
+def test_threshold():
+    """ Classes within their threshold are not traded """
+    model = create_model()
+    model.get_class_by_name("Bonds").threshold = Decimal(70)
+    rebalancer = Rebalancer(model)
+    rebalancer.thresholds = {"Equity": Decimal(50)}
+
+    plan = rebalancer.rebalance()
+
+    assert not plan.trades
+
+
+def test_min_trade():
+    """ Trades below the minimum are skipped """
+    rebalancer = Rebalancer(create_model())
+    rebalancer.min_trade = Decimal(250)
+
+    plan = rebalancer.rebalance()
+
+    assert not plan.trades
+
+
+def create_leaf(model: AssetAllocationModel, name: str, allocation: int) -> AssetClass:
+    """ Adds a first-level class """
+    ac = AssetClass()
+    ac.name = name
+    ac.allocation = Decimal(allocation)
+    model.classes.append(ac)
+    model.add_asset_class(ac)
+    return ac
+
+
+def add_stock(model: AssetAllocationModel, ac: AssetClass, symbol: str, price, quantity,
+              currency: str = "EUR") -> Stock:
+    """ Adds a holding in the base currency """
+    stock = Stock(symbol)
+    stock.price = Decimal(price)
+    stock.currency = currency
+    stock.quantity = Decimal(quantity)
+    stock.value_in_base_currency = stock.price * stock.quantity
+    stock.parent = ac
+    ac.stocks.append(stock)
+    model.add_stock(stock)
+    return stock
+
+
+def test_sell_skips_expensive_holding():
+    """ A holding too expensive to sell in whole shares is skipped for the cheaper ones """
+    model = AssetAllocationModel()
+    model.currency = "EUR"
+    equity = create_leaf(model, "Equity", 56)
+    add_stock(model, equity, "VTI", 1000, "0.8")
+    add_stock(model, equity, "CHEAP", 10, 10)
+    add_stock(model, create_leaf(model, "Bonds", 44), "AGG", 10, 10)
+    model.recalculate()
+
+    plan = Rebalancer(model).rebalance()
+
+    sales = [(trade.symbol, trade.quantity) for trade in plan.trades if trade.action == "sell"]
+    assert sales == [("CHEAP", Decimal(-10))]
+    # Still 140 over the set value.
+    assert [name for name, _ in plan.unresolved] == ["Equity"]
+
+
+def test_buy_unheld_security_in_other_currency():
+    """ The model's exchange rates allow buying a security that is not held yet """
+    model = AssetAllocationModel()
+    model.currency = "EUR"
+    model.exchange_rates = {"USD": Decimal("0.5")}
+    add_stock(model, create_leaf(model, "Equity", 50), "VTI", 100, 0, "USD")
+    add_stock(model, create_leaf(model, "Bonds", 50), "AGG", 10, 100)
+    model.recalculate()
+
+    plan = Rebalancer(model).rebalance()
+
+    trades = {trade.symbol: trade for trade in plan.trades}
+    assert trades["VTI"].quantity == Decimal(10)
+    assert trades["VTI"].value_in_base_currency == Decimal(500)
+    assert not plan.unresolved
+
+
+def test_buy_expensive_first_and_sell_whole_shares():
+    """ The cheaper security takes what is left after the expensive one, sales never overshoot """
+    model = AssetAllocationModel()
+    model.currency = "EUR"
+    add_stock(model, create_leaf(model, "Equity", 50), "VTI", 10, 75)
+    bonds = create_leaf(model, "Bonds", 50)
+    add_stock(model, bonds, "BND", 7, 36)
+    add_stock(model, bonds, "AGG", 100, 0)
+    model.recalculate()
+    rebalancer = Rebalancer(model)
+    rebalancer.threshold = Decimal(1)
+
+    plan = rebalancer.rebalance()
+
+    # 249 to sell and to buy.
+    assert [(trade.symbol, trade.quantity) for trade in plan.trades] == \
+        [("VTI", Decimal(-24)), ("AGG", Decimal(2)), ("BND", Decimal(7))]
+    assert plan.unresolved == [("Equity", "-9.00 left after whole-share trades")]
+
+
+def test_liquidation_keeps_fraction():
+    """ Only whole shares of a fractional holding are sold """
+    model = AssetAllocationModel()
+    model.currency = "EUR"
+    add_stock(model, create_leaf(model, "Equity", 0), "VTI", 10, "7.5")
+    add_stock(model, create_leaf(model, "Bonds", 100), "AGG", 1, 25)
+    model.recalculate()
+
+    plan = Rebalancer(model).rebalance()
+
+    sales = [(trade.symbol, trade.quantity) for trade in plan.trades if trade.action == "sell"]
+    assert sales == [("VTI", Decimal(-7))]
+
+
+def test_contribution_to_underweight():
+    """ A small contribution goes to the most underweight class only """
+    plan = ContributionAllocator(create_model()).allocate(Decimal(200))
+
+    assert [(item.asset_class, item.amount) for item in plan.classes] == [("Bonds", 200)]
+    assert plan.classes[0].securities == {"AGG": 200}
+
+
+def test_contribution_levels_classes():
+    """ A larger contribution brings the classes to the same level, then raises them together """
+    plan = ContributionAllocator(create_model()).allocate(Decimal(600))
+
+    amounts = {item.asset_class: round(item.amount, 2) for item in plan.classes}
+    assert amounts == {"Bonds": Decimal("400.00"), "Equity": Decimal("200.00")}
+
+
+def test_withdrawal():
+    """ Withdrawals come from the most overweight class, up to the holdings """
+    allocator = ContributionAllocator(create_model())
+
+    plan = allocator.allocate(Decimal(-200))
+    assert [(item.asset_class, item.amount) for item in plan.classes] == [("Equity", -200)]
+    assert plan.classes[0].securities == {"VTI": -200}
+
+    plan = allocator.allocate(Decimal(-2000))
+    assert sum(item.amount for item in plan.classes) == Decimal(-900)
+    assert plan.unallocated == Decimal(-1100)
+
+
+def test_contribution_without_security():
+    """ The amount for a class without a priced security is reported as not allocated """
+    model = create_model()
+    model.unpriced_symbols = ["AGG"]
+
+    plan = ContributionAllocator(model).allocate(Decimal(200))
+
+    assert plan.classes[0].securities == {}
+    assert plan.unallocated == Decimal(200)
+    assert "Not allocated: 200.00" in plan.format()
+
+
+def test_contribution_without_allocation():
+    """ Nothing to distribute to when no class has a set allocation """
+    model = create_model()
+    for ac in model.asset_classes:
+        ac.alloc_value = Decimal(0)
+
+    plan = ContributionAllocator(model).allocate(Decimal(500))
+
+    assert not plan.classes
+    assert plan.unallocated == Decimal(500)
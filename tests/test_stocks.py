@@ -1,9 +1,99 @@
 """ Tests for stocks operations """
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pytest
+from asset_allocation.config import ConfigKeys
 from asset_allocation.stocks import StocksInfo
 
+SYMBOLS = ["BENCH:S00000", "BENCH:S00001", "BENCH:S00002", "BENCH:S00003"]
+
 def test_value_reading(config):
     """ Retrieve value from GnuCash """
     unit = StocksInfo(config)
     value = unit.load_stock_quantity("ASX:VHY")
 
     assert value is not None
+
+def add_transaction(book_path: str, account_name: str, account_type: str, mnemonic: str,
+                    quantity: Decimal, post_date: date):
+    """ Books a quantity of the security into the account, against the bank """
+    from piecash import Account, Split, Transaction, open_book
+
+    book = open_book(book_path, readonly=False, open_if_lock=True)
+    security = book.commodities(namespace="BENCH", mnemonic=mnemonic)
+    bank = book.accounts(name="Bank")
+    account = book.session.query(Account).filter(Account.name == account_name).first()
+    if not account:
+        account = Account(account_name, account_type, security, parent=book.root_account)
+    Transaction(book.default_currency, "test", post_date=post_date, splits=[
+        Split(account, value=quantity, quantity=quantity),
+        Split(bank, value=-quantity)])
+    book.save()
+    book.close()
+
+def test_bulk_quantities(dataset):
+    """ Quantities loaded in one pass match the per-symbol loading """
+    book_path = str(dataset.get(ConfigKeys.gnucash_book_path))
+    unit = StocksInfo(dataset)
+    before = unit.load_stock_quantities(SYMBOLS)
+    unit.close_databases()
+
+    # A short position in a liability account counts with the reversed sign, as in GnuCash.
+    add_transaction(book_path, "Short", "LIABILITY", "S00001", Decimal(-2), date.today())
+    # Transactions in the future are not counted.
+    add_transaction(book_path, "S00002", "STOCK", "S00002", Decimal(7),
+                    date.today() + timedelta(days=5))
+
+    unit = StocksInfo(dataset)
+    actual = unit.load_stock_quantities(SYMBOLS)
+
+    assert actual["BENCH:S00001"] == before["BENCH:S00001"] + 2
+    assert actual["BENCH:S00002"] == before["BENCH:S00002"]
+    for symbol in SYMBOLS:
+        assert actual[symbol] == unit.load_stock_quantity(symbol)
+    # Symbols without the namespace are accepted.
+    assert unit.load_stock_quantities(["S00003"])["S00003"] == actual["BENCH:S00003"]
+    with pytest.raises(ValueError):
+        unit.load_stock_quantities(["BENCH:NONE"])
+
+def test_security_balances(dataset):
+    """ Only the securities with a positive balance are returned, by full symbol """
+    book_path = str(dataset.get(ConfigKeys.gnucash_book_path))
+    unit = StocksInfo(dataset)
+    before = unit.load_stock_quantities(SYMBOLS)
+    unit.close_databases()
+    # Sell all of one security.
+    add_transaction(book_path, "S00001", "STOCK", "S00001", -before["BENCH:S00001"],
+                    date.today())
+
+    unit = StocksInfo(dataset)
+    actual = unit.load_security_balances()
+
+    assert sorted(actual) == ["BENCH:S00000", "BENCH:S00002", "BENCH:S00003"]
+    for symbol, quantity in actual.items():
+        assert quantity == before[symbol]
+        assert quantity == unit.load_stock_quantity(symbol)
+
+def test_bulk_latest_prices(tmp_path):
+    """ The latest prices for all the symbols are read at once """
+    from pricedb import dal, SecuritySymbol
+
+    session = dal.get_session(str(tmp_path / "prices.db"))
+    session.add(dal.Price(namespace="ASX", symbol="VHY", date="2018-01-01",
+                          time="10:00:00", value=100, denom=100, currency="AUD"))
+    session.add(dal.Price(namespace="ASX", symbol="VHY", date="2018-01-02",
+                          time="10:00:00", value=250, denom=100, currency="AUD"))
+    session.add(dal.Price(namespace="NYSE", symbol="VTI", date="2018-01-01",
+                          time="10:00:00", value=140, denom=1, currency="USD"))
+    session.commit()
+
+    unit = StocksInfo(config=object())
+    unit.pricedb_session = session
+    symbols = [SecuritySymbol("ASX", "VHY"), SecuritySymbol(None, "VTI"),
+               SecuritySymbol("ASX", "NONE")]
+    actual = unit.load_latest_prices(symbols)
+
+    assert actual[("ASX", "VHY")].value == Decimal("2.5")
+    assert actual[(None, "VTI")].currency == "USD"
+    assert ("ASX", "NONE") not in actual
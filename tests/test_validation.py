@@ -0,0 +1,55 @@
+""" Tests for model validation """
+from decimal import Decimal
+
+from asset_allocation.model import AssetAllocationModel, AssetClass, Stock
+from asset_allocation.validation import IssueType, ModelValidator
+
+
+def create_class(model: AssetAllocationModel, name: str, allocation: int, parent: AssetClass = None):
+    """ Adds an asset class to the model """
+    ac = AssetClass()
+    ac.name = name
+    ac.allocation = Decimal(allocation)
+    if parent:
+        ac.parent = parent
+        parent.classes.append(ac)
+    else:
+        model.classes.append(ac)
+    model.add_asset_class(ac)
+    return ac
+
+def test_valid_model():
+    """ A consistent model has no issues """
+    model = AssetAllocationModel()
+    equity = create_class(model, "Equity", 60)
+    create_class(model, "Domestic", 20, equity)
+    create_class(model, "International", 40, equity)
+    create_class(model, "Cash", 40)
+
+    report = ModelValidator(model).validate()
+
+    assert report.is_valid
+
+def test_all_issues_collected():
+    """ All the issues are reported, not only the first one """
+    model = AssetAllocationModel()
+    equity = create_class(model, "Equity", 60)
+    intl = create_class(model, "International", 30, equity)
+    create_class(model, "Deep", 10, intl)
+    stock = Stock("VTI")
+    stock.parent = equity
+    equity.stocks.append(stock)
+    model.add_stock(stock)
+    model.add_stock(Stock("VTI"))
+    model.unpriced_symbols.append("VTI")
+    model.orphaned_class_ids.append(7)
+
+    report = ModelValidator(model).validate()
+
+    assert len(report.get_issues(IssueType.allocation_mismatch)) == 2
+    assert report.get_issues(IssueType.total_allocation)
+    assert report.get_issues(IssueType.mixed_class)
+    assert report.get_issues(IssueType.duplicate_symbol)
+    assert report.get_issues(IssueType.missing_price)
+    assert report.get_issues(IssueType.orphaned_class)
+    assert "allocation_mismatch" in report.format()
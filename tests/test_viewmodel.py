@@ -1,2 +1,75 @@
 """ View Model mapping tests """
 
+import io
+from decimal import Decimal
+
+from asset_allocation.formatters import AsciiFormatter, HtmlFormatter
+from asset_allocation.maps import ModelMapper
+from asset_allocation.model import AssetAllocationModel, AssetClass, Stock
+
+
+def create_model() -> AssetAllocationModel:
+    """ Equity with one child class holding a stock, and Cash """
+    model = AssetAllocationModel()
+    model.currency = "EUR"
+    for name in ["Equity", "Cash"]:
+        ac = AssetClass()
+        ac.name = name
+        ac.allocation = Decimal(50)
+        model.classes.append(ac)
+        model.add_asset_class(ac)
+    child = AssetClass()
+    child.name = "International"
+    child.allocation = Decimal(50)
+    child.depth = 1
+    model.classes[0].classes.append(child)
+    model.add_asset_class(child)
+    stock = Stock("VTI")
+    stock.price = Decimal(10)
+    stock.currency = "EUR"
+    stock.quantity = Decimal(2)
+    stock.value_in_base_currency = Decimal(20)
+    child.stocks.append(stock)
+    model.add_stock(stock)
+    model.classes[1].stocks.append(Stock("CASH"))
+    model.classes[1].stocks[0].value_in_base_currency = Decimal(20)
+    model.recalculate()
+    return model
+
+def test_row_order():
+    """ Rows come in display order: class, child classes, stocks """
+    rows = ModelMapper(create_model()).iterate_linear(with_stocks=True)
+
+    assert [row.name for row in rows] == ["Equity", "International", "VTI", "Cash", "CASH"]
+
+def test_streamed_output():
+    """ Writing to a stream gives the same output as format """
+    model = create_model()
+    stream = io.StringIO()
+
+    AsciiFormatter().write(model, stream, full=True)
+
+    assert stream.getvalue() == AsciiFormatter().format(model, full=True)
+
+def test_html_output():
+    """ HTML contains one row per line, with the depth and the drift colors """
+    model = create_model()
+    stream = io.StringIO()
+
+    HtmlFormatter().write(model, stream, full=True)
+    output = stream.getvalue()
+
+    assert output == HtmlFormatter().format(model, full=True)
+    assert output.count("<tr class=") == 5
+    assert '<tr class="class-row" data-depth="1">' in output
+    assert '<tr class="stock-row" data-depth="2">' in output
+    assert "VTI" in output
+
+def test_html_drift_threshold():
+    """ Only the rows with the allocation difference from the drift threshold are colored """
+    model = create_model()
+
+    assert "num over" not in HtmlFormatter(drift_threshold=Decimal(1000)).format(model)
+    assert "num under" not in HtmlFormatter(drift_threshold=Decimal(1000)).format(model)
+    output = HtmlFormatter(drift_threshold=Decimal(0)).format(model)
+    assert "num over" in output or "num under" in output